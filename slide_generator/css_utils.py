@@ -5,10 +5,35 @@ This module consolidates all CSS variable extraction, font size parsing,
 and other CSS-related operations that were previously duplicated across 
 multiple files (layout_engine.py, layout_parser.py, pptx_renderer.py).
 """
+import functools
 import re
 from typing import Dict, Optional, List, Tuple, Any
 from .theme_loader import get_css
 
+# :root { ... } block, its --name: value; declarations, and px magnitudes
+_ROOT_RE = re.compile(r':root\s*\{([^}]+)\}', re.DOTALL)
+_VAR_RE = re.compile(r'--([^:]+):\s*([^;]+);')
+_PX_RE = re.compile(r'(\d+)px')
+
+
+@functools.lru_cache(maxsize=16)
+def _parse_css_variables(css_content: str) -> Optional[Tuple[Tuple[str, str], ...]]:
+    """Parse ``--name: value;`` pairs from the :root block, or None if absent.
+
+    Keyed on the CSS text so every parser built for the same theme shares one
+    parse, while an edited theme file still gets re-parsed.
+    """
+    root_match = _ROOT_RE.search(css_content)
+    if not root_match:
+        return None
+    return tuple((name.strip(), value.strip()) for name, value in _VAR_RE.findall(root_match.group(1)))
+
+
+@functools.lru_cache(maxsize=256)
+def _px_from_value(value: str) -> Optional[int]:
+    """Integer pixel magnitude of a CSS value such as ``'1280px'``."""
+    px_match = _PX_RE.search(value)
+    return int(px_match.group(1)) if px_match else None
 
 class CSSParser:
     """
@@ -31,16 +56,11 @@ class CSSParser:
             return self._css_vars
             
         # Extract CSS variables from :root section
-        root_match = re.search(r':root\s*\{([^}]+)\}', self.css_content, re.DOTALL)
-        if not root_match:
+        css_vars = _parse_css_variables(self.css_content)
+        if css_vars is None:
             raise ValueError(f"No :root section found in theme '{self.theme}'")
         
-        root_content = root_match.group(1)
-        
-        # Parse all CSS variables at once
-        variable_pattern = r'--([^:]+):\s*([^;]+);'
-        css_vars = re.findall(variable_pattern, root_content)
-        self._css_vars = {name.strip(): value.strip() for name, value in css_vars}
+        self._css_vars = dict(css_vars)
         
         return self._css_vars
     
@@ -52,11 +72,11 @@ class CSSParser:
             raise ValueError(f"CSS variable '--{variable_name}' not found in theme '{self.theme}'")
         
         # Extract pixel value
-        px_match = re.search(r'(\d+)px', value)
-        if not px_match:
+        px_value = _px_from_value(value)
+        if px_value is None:
             raise ValueError(f"CSS variable '--{variable_name}' is not a pixel value: {value}")
         
-        return int(px_match.group(1))
+        return px_value
     
     def get_raw_value(self, variable_name: str) -> str:
         """Get raw CSS variable value."""
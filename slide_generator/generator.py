@@ -9,6 +9,7 @@ from pathlib import Path
 
 from .paths import prepare_workspace
 from .layout_engine import LayoutEngine
+from .layout_parser import close_shared_browser
 from .pptx_renderer import PPTXRenderer
 
 logger = logging.getLogger(__name__)
@@ -145,7 +146,11 @@ def main():
             base_dir=asset_base,
         )
         
-        output_path = await generator.generate(markdown_text, args.output)
+        try:
+            output_path = await generator.generate(markdown_text, args.output)
+        finally:
+            # asyncio.run closes the loop next, so release Chromium while it can
+            await close_shared_browser()
         logger.info("✅ Presentation written to %s", output_path)
     
     # Set up logging
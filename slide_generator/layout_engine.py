@@ -2,16 +2,22 @@
 """Layout engine for measuring HTML elements and pagination."""
 
 import base64
+import functools
+import json
 import logging
 import mimetypes
 import os
 import re
 import requests
-from html import unescape
+import threading
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from html import escape, unescape
 from pathlib import Path
-from typing import List, Optional, Callable, Dict, Tuple
+from typing import List, Optional, Callable, Dict, TextIO, Tuple
 from io import BytesIO
 
+import numpy as np
 from bs4 import BeautifulSoup
 from PIL import Image
 
@@ -23,13 +29,155 @@ from .theme_loader import get_css
 
 logger = logging.getLogger(__name__)
 
+try:
+    import lxml  # noqa: F401 – C-backed tree builder, much faster than html.parser
+    _FAST_PARSER = 'lxml'
+except ModuleNotFoundError:  # pragma: no cover – optional speed-up
+    _FAST_PARSER = 'html.parser'
+
+# Splits the <br>-joined items of a preprocessed list paragraph
+_BR_TAG_RE = re.compile(r'<br[^>]*>', re.IGNORECASE)
+# <img> tags and their src attribute in serialized debug HTML
+_IMG_TAG_RE = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+_SRC_ATTR_RE = re.compile(r'(?<![\w-])src="([^"]*)"', re.IGNORECASE)
+# <img data-caption> not already followed by its figure-caption paragraph
+_IMG_CAPTION_RE = re.compile(
+    r'<img\b[^>]*?\sdata-caption="([^"]*)"[^>]*>'
+    r'(?!\s*<p\b[^>]*\sclass="(?:[^"]*\s)?figure-caption[\s"])',
+    re.IGNORECASE,
+)
+# List containers flattened into <p data-list-levels> paragraphs for measurement
+_LIST_TAGS = ('ul', 'ol')
+# Preprocessed list paragraphs in serialized debug HTML, and their list type
+_LIST_PARAGRAPH_RE = re.compile(r'<p\b([^>]*?\sdata-list-levels="([^"]*)"[^>]*)>(.*?)</p>',
+                                re.IGNORECASE | re.DOTALL)
+_LIST_TYPE_ATTR_RE = re.compile(r'\sdata-list-type="([^"]*)"', re.IGNORECASE)
+# Inline formatting kept by _clean_html_for_measurement: tags -> markdown markers
+# (one alternative per kind, combined into a single pattern) ...
+_INLINE_TAG_ALTERNATIVES = {
+    'strong': (r'<(?P<strong_tag>strong|b)\b[^>]*>(?P<strong>.*?)</(?P=strong_tag)>', '**'),
+    'em': (r'<(?P<em_tag>em|i)\b[^>]*>(?P<em>.*?)</(?P=em_tag)>', '*'),
+    'code': (r'<code\b[^>]*>(?P<code>.*?)</code>', '`'),
+    'mark': (r'<mark\b[^>]*>(?P<mark>.*?)</mark>', '=='),
+}
+_INLINE_TAG_RES: Dict[frozenset, re.Pattern] = {}  # excluded kinds -> combined pattern
+_NON_INLINE_TAG_RE = re.compile(r'<(?!/?(?:span|u|del|strong|b|em|i|code|mark)\b)[^>]+>', re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r'\s+')
+# ... and markdown markers -> tags
+_MD_STRONG_RE = re.compile(r'\*\*(.*?)\*\*')
+_MD_EM_RE = re.compile(r'\*(.*?)\*')
+_MD_CODE_RE = re.compile(r'`(.*?)`')
+_MD_MARK_RE = re.compile(r'==(.*?)==')
+# First colour declared in the theme's body rule
+_BODY_COLOR_RE = re.compile(r'body\s*{[^}]*?color:\s*([^;\s]+)', re.IGNORECASE | re.DOTALL)
+
+# Blocks taller than this count as large content for pagination rules
+_LARGE_CONTENT_HEIGHT_PX = 200
+
+# Tag groups used by the pagination rules
+_SECTION_HEADING_TAGS = frozenset({'h1', 'h2', 'h3'})
+_TEXT_TAGS = frozenset({'p', 'h2', 'h3'})
+_GROUP_CHILD_TAGS = frozenset({'h3', 'table', 'img', 'p'})  # may follow an h1
+_H3_CHILD_TAGS = frozenset({'table', 'img', 'p'})  # may follow an h3
+# Page content type contributed by each tag
+_TAG_CONTENT_TYPES = {'img': 'image', 'table': 'table', 'h1': 'heading',
+                      **dict.fromkeys(_TEXT_TAGS, 'text')}
+
+# Bytes read up front when probing an image header for its size
+_IMAGE_HEADER_PROBE_BYTES = 65536
+
+
+def _inline_tags_to_markers(text: str, excluded: frozenset = frozenset()) -> str:
+    """
+    Convert preserved inline tags to markdown markers in a single regex pass.
+
+    The content of a converted tag is converted recursively, skipping the kinds
+    already enclosing it. On well-formed markup that doesn't nest a kind inside
+    itself this gives the same result as one ``re.sub`` per kind run in order.
+    """
+    if len(excluded) == len(_INLINE_TAG_ALTERNATIVES):
+        return text
+    pattern = _INLINE_TAG_RES.get(excluded)
+    if pattern is None:
+        pattern = _INLINE_TAG_RES[excluded] = re.compile(
+            '|'.join(alt for kind, (alt, _) in _INLINE_TAG_ALTERNATIVES.items() if kind not in excluded),
+            re.IGNORECASE | re.DOTALL,
+        )
+
+    def _dispatch(match):
+        kind = match.lastgroup
+        marker = _INLINE_TAG_ALTERNATIVES[kind][1]
+        return marker + _inline_tags_to_markers(match.group(kind), excluded | {kind}) + marker
+
+    return pattern.sub(_dispatch, text)
+
+@functools.lru_cache(maxsize=4096)
+def _clean_html_for_measurement(text: str) -> str:
+    """
+    Clean HTML tags but preserve inline formatting for measurement.
+
+    Memoized: list items often repeat the same inline HTML across a deck.
+    """
+    # First, handle inline formatting tags that we want to preserve
+    # Convert them to a temporary format
+    text = _inline_tags_to_markers(text)
+    
+    # Remove all other HTML tags EXCEPT inline formatting we want to preserve
+    # Keep span/u/del/strong/em/i/b/code/mark tags with any attributes
+    text = _NON_INLINE_TAG_RE.sub('', text)
+    
+    # Clean up whitespace
+    text = _WHITESPACE_RE.sub(' ', text).strip()
+    
+    # Convert back to HTML formatting tags
+    text = _MD_STRONG_RE.sub(r'<strong>\1</strong>', text)
+    text = _MD_EM_RE.sub(r'<em>\1</em>', text)
+    text = _MD_CODE_RE.sub(r'<code>\1</code>', text)
+    text = _MD_MARK_RE.sub(r'<mark>\1</mark>', text)
+    
+    return unescape(text)
+
+
+def _probe_image_size(image_path: str) -> Tuple[int, int]:
+    """Read an image's size from its header without decoding pixel data.
+
+    The first 64 KB are read in one go and handed to PIL, whose ``open`` only
+    parses the header. Files whose header does not fit (e.g. JPEGs with very
+    large EXIF blocks) fall back to opening the file directly.
+    """
+    with open(image_path, 'rb') as f:
+        head = f.read(_IMAGE_HEADER_PROBE_BYTES)
+    try:
+        with Image.open(BytesIO(head)) as img:
+            return img.size
+    except Exception:
+        with Image.open(image_path) as img:
+            return img.size
+
 
 class ImageDimensionCache:
-    """Cache for image dimensions to avoid repeated PIL Image.open calls."""
+    """Cache for image dimensions to avoid repeated PIL Image.open calls.
+
+    Local files can additionally be persisted to a JSON *cache_file* holding one
+    ``[width, height, mtime_ns, size]`` entry per absolute path, so repeated
+    builds skip PIL entirely while an edited image is re-probed.
+    """
     
-    def __init__(self, debug: bool = False):
+    def __init__(self, debug: bool = False, cache_file: Optional[Path] = None):
         self.cache: Dict[str, Tuple[int, int]] = {}
+        self.aspect_ratios: Dict[str, float] = {}  # width / height, filled alongside cache
         self.debug = debug
+        self.cache_file = Path(cache_file) if cache_file else None
+        self._disk_cache: Dict[str, List[int]] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if self.cache_file and self.cache_file.exists():
+            try:
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    self._disk_cache = json.load(f)
+            except (OSError, ValueError) as e:
+                if self.debug:
+                    logger.warning(f"⚠️ Ignoring unreadable image dimension cache {self.cache_file}: {e}")
     
     def get_dimensions(self, image_path: str) -> Tuple[Optional[int], Optional[int]]:
         """
@@ -59,11 +207,22 @@ class ImageDimensionCache:
                 with Image.open(image_data) as img:
                     dimensions = img.size
             else:
-                # Handle local files
-                with Image.open(image_path) as img:
-                    dimensions = img.size
+                # Handle local files – a stat is enough to validate the disk cache
+                st = os.stat(image_path)
+                disk_key = os.path.abspath(image_path)
+                cached = self._disk_cache.get(disk_key)
+                if cached and cached[2:] == [st.st_mtime_ns, st.st_size]:
+                    dimensions = (cached[0], cached[1])
+                else:
+                    dimensions = _probe_image_size(image_path)
+                    with self._lock:
+                        self._disk_cache[disk_key] = [*dimensions, st.st_mtime_ns, st.st_size]
+                        self._dirty = True
             
-            self.cache[image_path] = dimensions
+            aspect_ratio = dimensions[0] / dimensions[1]
+            with self._lock:
+                self.aspect_ratios[image_path] = aspect_ratio
+                self.cache[image_path] = dimensions
             if self.debug:
                 logger.debug(f"📷 Cached new image dimensions for {image_path}: {dimensions}")
             return dimensions
@@ -72,14 +231,49 @@ class ImageDimensionCache:
                 logger.warning(f"⚠️ Could not read image dimensions for {image_path}: {e}")
             return None, None
 
+    def get_aspect_ratio(self, image_path: str) -> Optional[float]:
+        """Return the cached width / height ratio of an image, or None if unreadable."""
+        if image_path not in self.aspect_ratios:
+            self.get_dimensions(image_path)
+        return self.aspect_ratios.get(image_path)
+
+    def prewarm(self, image_paths: List[str], max_workers: int = 8) -> None:
+        """Probe uncached images concurrently so later lookups hit the cache."""
+        pending = list(dict.fromkeys(p for p in image_paths if p and p not in self.cache))
+        if len(pending) < 2:
+            return
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+            list(executor.map(self.get_dimensions, pending))
+
+    def flush(self) -> None:
+        """Write newly probed local image dimensions to ``cache_file``.
+
+        Entries for images that no longer exist are dropped, so the file only
+        ever holds one entry per image still on disk.
+        """
+        if not self._dirty or not self.cache_file:
+            return
+        with self._lock:
+            self._disk_cache = {path: entry for path, entry in self._disk_cache.items()
+                                if os.path.exists(path)}
+        tmp_path = self.cache_file.with_suffix(self.cache_file.suffix + '.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._disk_cache, f)
+            os.replace(tmp_path, self.cache_file)
+            self._dirty = False
+        except OSError as e:
+            if self.debug:
+                logger.warning(f"⚠️ Could not write image dimension cache {self.cache_file}: {e}")
+
 
 class ImageScaler:
     """Utility class for consistent image scaling logic."""
     
-    def __init__(self, css_parser: CSSParser, debug: bool = False):
+    def __init__(self, css_parser: CSSParser, debug: bool = False, cache_file: Optional[Path] = None):
         self.css_parser = css_parser
         self.debug = debug
-        self.image_cache = ImageDimensionCache(debug)
+        self.image_cache = ImageDimensionCache(debug, cache_file=cache_file)
         
         # Cache frequently used values
         self.viewport_width = css_parser.get_px_value('slide-width')
@@ -113,7 +307,7 @@ class ImageScaler:
         if original_width is None or original_height is None:
             return None, None
         
-        aspect_ratio = original_width / original_height
+        aspect_ratio = self.image_cache.aspect_ratios[image_path]
         
         # Determine base dimensions
         if in_column:
@@ -169,37 +363,73 @@ class PaginationRule:
         self.action = action  # "break" or "allow"
         self.priority = priority  # Higher priority rules are checked first
 
-def _get_page_content_types(current_page: List[Block]) -> set:
+def _add_block_content_types(types: set, block: Block) -> None:
+    """Add the content types contributed by a single block to *types*."""
+    if block.height > _LARGE_CONTENT_HEIGHT_PX:
+        types.add('large_content')
+    content_type = _TAG_CONTENT_TYPES.get(block.tag)
+    if content_type is not None:
+        types.add(content_type)
+
+
+class _Page:
+    """
+    Blocks of the page currently being built by :func:`paginate`.
+
+    Keeps a running summary of the page up to date on every append so the
+    pagination rules don't have to rescan the page for each incoming block.
+    The blocks live in a private list rather than a list subclass, so
+    ``append`` is the only way to add one and the summary cannot go stale.
+    """
+
+    def __init__(self):
+        self.blocks: List[Block] = []
+        self.content_types = set()
+        self.last_heading_idx = None  # index of the most recent heading
+        self.height_prefix = [0]  # height_prefix[k] = total height of the first k blocks
+        self.min_y = None  # smallest block.y on the page
+        self.is_lonely_heading = False  # see _is_lonely_heading
+        self.is_heading_section = False  # see _is_heading_section
+
+    def append(self, block: Block) -> None:
+        count = len(self.blocks)
+        if block.is_heading():
+            self.last_heading_idx = count
+        if count == 0:
+            self.is_lonely_heading = self.is_heading_section = block.tag in _SECTION_HEADING_TAGS
+        else:
+            self.is_lonely_heading = False
+            self.is_heading_section = (count == 1 and self.is_heading_section and
+                                       block.tag in _TEXT_TAGS)
+        self.blocks.append(block)
+        _add_block_content_types(self.content_types, block)
+        self.height_prefix.append(self.height_prefix[-1] + block.height)
+        if self.min_y is None or block.y < self.min_y:
+            self.min_y = block.y
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def __getitem__(self, index):
+        return self.blocks[index]
+
+
+def _get_page_content_types(current_page: _Page) -> set:
     """Get set of content types on current page."""
-    types = set()
-    for block in current_page:
-        if block.height > 200:
-            types.add('large_content')
-        if block.tag in ['img']:
-            types.add('image')
-        if block.tag in ['table']:
-            types.add('table')
-        if block.tag == 'h1':
-            types.add('heading')
-        if block.tag in ['p', 'h2', 'h3']:
-            types.add('text')
-    return types
-
-
-def _is_heading_section(current_page: List[Block]) -> bool:
+    return current_page.content_types
+
+
+def _is_heading_section(current_page: _Page) -> bool:
     """Check if current page is just a heading section (h1/h2/h3 + optional text)."""
-    if not current_page or len(current_page) > 2:
-        return False
-    if current_page[0].tag not in ['h1', 'h2', 'h3']:
-        return False
-    if len(current_page) == 2 and current_page[1].tag not in ['p', 'h2', 'h3']:
-        return False
-    return True
+    return current_page.is_heading_section
 
 
-def _is_lonely_heading(current_page: List[Block]) -> bool:
+def _is_lonely_heading(current_page: _Page) -> bool:
     """Check if current page has only a lonely heading (H1, H2, or H3)."""
-    return len(current_page) == 1 and current_page[0].tag in ['h1', 'h2', 'h3']
+    return current_page.is_lonely_heading
 
 
 def _is_divider_slide(page_blocks: List[Block]) -> bool:
@@ -212,13 +442,13 @@ def _is_divider_slide(page_blocks: List[Block]) -> bool:
     
     # Check if all blocks are headings
     for block in page_blocks:
-        if block.tag not in ['h1', 'h2', 'h3']:
+        if block.tag not in _SECTION_HEADING_TAGS:
             return False
     
     return True
 
 
-def _should_keep_content_group_together(current_page: List[Block], new_block: Block, max_height: int) -> bool:
+def _should_keep_content_group_together(current_page: _Page, new_block: Block, max_height: int) -> bool:
     """
     Determine if a new block should be kept with the current page based on content grouping.
     Analyzes logical content groups (heading + children) and their combined heights.
@@ -227,41 +457,35 @@ def _should_keep_content_group_together(current_page: List[Block], new_block: Bl
         return False
     
     # Find the most recent heading on the current page
-    recent_heading_idx = None
-    for i in range(len(current_page) - 1, -1, -1):
-        if current_page[i].is_heading():
-            recent_heading_idx = i
-            break
+    page = current_page
+    recent_heading_idx = page.last_heading_idx
     
     if recent_heading_idx is None:
         return False  # No heading to group with
     
-    recent_heading = current_page[recent_heading_idx]
+    recent_heading = page[recent_heading_idx]
     
     # Determine if new_block is likely a child of the recent heading
     is_child_content = (
-        new_block.tag in ['h3', 'table', 'img', 'p'] and
+        new_block.tag in _GROUP_CHILD_TAGS and
         # h3 can be a child of h1, table/img/p can be children of h1/h3
         (recent_heading.tag == 'h1' or 
-         (recent_heading.tag == 'h3' and new_block.tag in ['table', 'img', 'p']))
+         (recent_heading.tag == 'h3' and new_block.tag in _H3_CHILD_TAGS))
     )
     
     if not is_child_content:
         return False
     
-    # Calculate the height of the content group (heading + its children + new block)
-    group_blocks = current_page[recent_heading_idx:] + [new_block]
-    group_height = sum(b.height for b in group_blocks)
-    
-    # Calculate remaining space on page (considering existing content before the group)
-    existing_height = sum(b.height for b in current_page[:recent_heading_idx])
+    # Heights come from the page's running prefix sums:
+    # content before the group, and the group (heading + its children + new block)
+    existing_height = page.height_prefix[recent_heading_idx]
+    group_height = page.height_prefix[-1] - existing_height + new_block.height
     available_space = max_height - existing_height
     
-    # Additional: if new_block belongs to same .column container as any block in group, force allow
+    # Additional: if new_block belongs to a .column container, force allow
+    # (the group includes new_block itself, so it always shares that container)
     if new_block.parentClassName and 'column' in new_block.parentClassName:
-        for b in group_blocks:
-            if b.parentClassName == new_block.parentClassName:
-                return True
+        return True
 
     # Allow slight overflow (≤ 10 %) so that a compact heading+paragraph+image
     # group isn't split across slides. This specifically fixes issues where the combined height exceeded the limit by just a few pixels.
@@ -273,13 +497,14 @@ def _should_keep_content_group_together(current_page: List[Block], new_block: Bl
     
     return False
 
-# Define pagination rules in order of priority
+# Define pagination rules in order of priority.
+# Helpers are bound as default arguments so each call is a local, not a global, lookup.
 PAGINATION_RULES = [
     # Rule 0: Keep content groups together based on logical structure
     PaginationRule(
         name="keep_content_groups_together",
-        condition=lambda page, block, max_h: (
-            _should_keep_content_group_together(page, block, max_h)
+        condition=lambda page, block, max_h, _keep=_should_keep_content_group_together: (
+            _keep(page, block, max_h)
         ),
         action="allow",
         priority=30
@@ -288,8 +513,8 @@ PAGINATION_RULES = [
     # Rule 1: Allow lonely headings to collect their content
     PaginationRule(
         name="allow_lonely_heading_with_any_content",
-        condition=lambda page, block, max_h: (
-            _is_lonely_heading(page)
+        condition=lambda page, block, max_h, _lonely=_is_lonely_heading: (
+            _lonely(page)
         ),
         action="allow",
         priority=25
@@ -298,37 +523,51 @@ PAGINATION_RULES = [
     # Rule 2: Multiple large images should be separated
     PaginationRule(
         name="separate_multiple_large_images",
-        condition=lambda page, block, max_h: (
-            'large_content' in _get_page_content_types(page) and
-            block.height > 200 and
-            not _is_heading_section(page)
+        condition=lambda page, block, max_h, _types=_get_page_content_types,
+                         _section=_is_heading_section, _large=_LARGE_CONTENT_HEIGHT_PX: (
+            'large_content' in _types(page) and
+            block.height > _large and
+            not _section(page)
         ),
         action="break",
         priority=10
     ),
 ]
 
+# Rules sorted by priority (higher first) once at import time
+_SORTED_PAGINATION_RULES = tuple(sorted(PAGINATION_RULES, key=lambda r: r.priority, reverse=True))
+
 
-def _should_break_page(current_page: List[Block], new_block: Block, max_height: int):
+def _pagination_rules_can_fire(current_page: _Page, block_height: float) -> bool:
+    """
+    Whether any pagination rule could match.
+
+    Every rule needs either a heading on the page (grouping, lonely heading)
+    or a large incoming block (image separation).
+    """
+    return current_page.last_heading_idx is not None or block_height > _LARGE_CONTENT_HEIGHT_PX
+
+
+def _should_break_page(current_page: _Page, new_block: Block, max_height: int):
     """
     Determine if a page break should occur based on configurable rules.
     Returns:
     - True: Rule says break page
     - False: Rule says allow (explicit override)
     - None: No rule matched, use default logic
+    
+    paginate only calls this when _pagination_rules_can_fire says a rule
+    could match.
     """
     if not current_page:
         return None
     
-    # Sort rules by priority (higher first)
-    sorted_rules = sorted(PAGINATION_RULES, key=lambda r: r.priority, reverse=True)
-    
-    for rule in sorted_rules:
+    for rule in _SORTED_PAGINATION_RULES:
         try:
             if rule.condition(current_page, new_block, max_height):
                 # Debug logging for content grouping decisions
                 if rule.name == "keep_content_groups_together":
-                    total_height = sum(b.height for b in current_page) + new_block.height
+                    total_height = current_page.height_prefix[-1] + new_block.height
                     logger.debug(f"📋 Content grouping: Keeping {new_block.tag}({new_block.height}px) with page (total: {total_height}px, limit: {max_height}px)")
                 
                 if rule.action == "break":
@@ -355,38 +594,30 @@ def paginate(blocks: List[Block], max_height_px: int = 540, padding_px: int = 19
         List of pages, where each page is a list of Block objects
     """
     pages = []
-    current_page = []
+    current_page = _Page()
     page_start_y = None  # Track where the current page starts
     _source_slide_idx = 0  # Track originating markdown slide index
+    oversized_threshold = max_height_px * 0.8  # 80% of slide height
     
-    # Simple pagination with lookahead grouping
-    processed_block_indices = set()  # Track which blocks have been processed as part of groups
-    
-    for i, block in enumerate(blocks):
-        # Skip blocks that were already processed as part of a group
-        if i in processed_block_indices:
-            continue
-
+    for block in blocks:
         # Annotate block with its originating markdown slide index
-        try:
-            block.source_slide = _source_slide_idx
-        except Exception:
-            pass
+        block.source_slide = _source_slide_idx
         # Handle explicit page breaks
         if block.is_page_break():
             # Encountered explicit page break – finish current page and advance logical slide index
             if current_page:
                 pages.append(current_page)
-            current_page = []
+            current_page = _Page()
             page_start_y = None
             _source_slide_idx += 1  # next blocks belong to following markdown slide
             continue
         
-        # Get the height of the block
+        # Get the geometry of the block once
         block_height = block.height
+        block_y = block.y
         
         # Check for oversized blocks and mark them
-        if block_height > max_height_px * 0.8:  # 80% of slide height
+        if block_height > oversized_threshold:
             block.oversized = True
         
         # Determine if this block fits on the current page
@@ -397,8 +628,12 @@ def paginate(blocks: List[Block], max_height_px: int = 540, padding_px: int = 19
             if page_start_y is None:
                 page_start_y = current_page[0].y
                   
-            # Apply content-aware pagination rules first
-            rule_decision = _should_break_page(current_page, block, max_height_px)
+            # Apply content-aware pagination rules first; the common
+            # plain-content case goes straight to the height check.
+            if _pagination_rules_can_fire(current_page, block_height):
+                rule_decision = _should_break_page(current_page, block, max_height_px)
+            else:
+                rule_decision = None
             
             # If rules explicitly allow, skip height checks
             if rule_decision is False:  # Explicit "allow" from rules
@@ -407,7 +642,7 @@ def paginate(blocks: List[Block], max_height_px: int = 540, padding_px: int = 19
                 should_start_new_page = True
             else:  # No rule matched (rule_decision is None), use simple height logic
                 # Simple height check - no spatial analysis needed
-                relative_y = block.y - page_start_y
+                relative_y = block_y - page_start_y
                 relative_bottom = relative_y + block_height
                 
                 # If this block would extend beyond the page boundary, start new page
@@ -421,7 +656,7 @@ def paginate(blocks: List[Block], max_height_px: int = 540, padding_px: int = 19
         if should_start_new_page:
             # Only add non-empty pages
             pages.append(current_page)
-            current_page = []
+            current_page = _Page()
             page_start_y = None
             
         # Add the block to the current page
@@ -429,26 +664,23 @@ def paginate(blocks: List[Block], max_height_px: int = 540, padding_px: int = 19
         
         # Set page start Y if this is the first block on the page
         if page_start_y is None:
-            page_start_y = block.y
+            page_start_y = block_y
     
     # Add the last page if it's not empty
     if current_page:
         pages.append(current_page)
     
-    # Normalize Y coordinates for each page
+    # Normalize Y coordinates for each page so the topmost block starts at the
+    # CSS padding position; each page already tracked its minimum Y on append.
     for page in pages:
         if not page:
             continue
-            
-        # Find the minimum Y coordinate on this page
-        min_y = min(block.y for block in page)
-        
-        # Adjust all Y coordinates to start from CSS padding position (dynamic from CSS variables)
-        page_top_margin = padding_px  # Use dynamic padding from CSS
-        for block in page:
-            block.y = block.y - min_y + page_top_margin
+        offset = padding_px - page.min_y
+        if offset:
+            for block in page:
+                block.y += offset
     
-    return pages
+    return [page.blocks for page in pages]
 
 
 class LayoutEngine:
@@ -470,7 +702,23 @@ class LayoutEngine:
         self.base_dir = base_dir or Path.cwd()
         self.css_parser = CSSParser(theme)
         self._default_tmp_dir = tmp_dir  # may be None; used if caller passes explicit tmp
-        self.image_scaler = ImageScaler(self.css_parser, debug)
+        # Slide geometry used on every measure_and_paginate call
+        self._slide_height_px = self.css_parser.get_px_value('slide-height')
+        self._padding_px = self.css_parser.get_px_value('slide-padding')
+        self._usable_height_px = self._slide_height_px - 2 * self._padding_px
+        # Derive theme text colour from CSS so math PNGs match theme
+        m = _BODY_COLOR_RE.search(self.css_parser.css_content)
+        self._theme_text_color = m.group(1).strip() if m else '#000000'
+        self.image_scaler = ImageScaler(
+            self.css_parser, debug,
+            cache_file=Path(tmp_dir) / "imgdims.json" if tmp_dir else None
+        )
+        # data-bid -> element of _original_soup, and -> its top-level ancestor
+        # (direct child of the .slide), both filled when BIDs are stamped
+        self._bid_index: Dict[str, object] = {}
+        self._bid_slide_roots: Dict[str, object] = {}
+        # (realpath, mtime) -> data: URI of images embedded in the debug preview
+        self._img_data_uri_cache: Dict[Tuple[str, float], str] = {}
     
     def convert_markdown_to_html(self, markdown_text):
         """Convert markdown to HTML with layout CSS."""
@@ -498,7 +746,7 @@ class LayoutEngine:
         combined_css = theme_css + "\n" + HTML_SPECIFIC_CSS
         
         # Combine HTML slides with proper UTF-8 document structure
-        full_html = f"""<!DOCTYPE html>
+        html_parts = [f"""<!DOCTYPE html>
 <html lang="en">
 <head>
 <meta charset="UTF-8">
@@ -509,17 +757,18 @@ class LayoutEngine:
 </style>
 </head>
 <body>
-"""
+"""]
+        last_idx = len(html_slides) - 1
         for i, html_slide in enumerate(html_slides):
-            full_html += f'<div class="slide" id="slide-{i}">\n{html_slide}\n</div>\n'
+            html_parts.append(f'<div class="slide" id="slide-{i}">\n{html_slide}\n</div>\n')
             
             # Add a page break marker (except after the last slide)
-            if i < len(html_slides) - 1:
-                full_html += '<div class="page-break"><!-- slide --></div>\n'
+            if i < last_idx:
+                html_parts.append('<div class="page-break"><!-- slide --></div>\n')
         
-        full_html += "</body></html>"
+        html_parts.append("</body></html>")
         
-        return full_html
+        return ''.join(html_parts)
     
     def _process_math_equations(self, html_content: str, temp_dir: Optional[str]) -> str:
         """
@@ -587,11 +836,8 @@ class LayoutEngine:
         try:
             from .math_renderer import get_math_renderer
             math_renderer = get_math_renderer(cache_dir=str(self.tmp_dir), debug=self.debug)
-            # Derive theme text colour from CSS so math PNGs match theme
-            css = get_css(self.theme)
-            m = re.search(r'body\s*{[^}]*?color:\s*([^;\s]+)', css, re.IGNORECASE | re.DOTALL)
-            theme_text_color = m.group(1).strip() if m else '#000000'
-            math_renderer.png_text_color = theme_text_color
+            # Theme text colour (derived once in __init__) so math PNGs match theme
+            math_renderer.png_text_color = self._theme_text_color
             
                             # For HTML debug output - text fallback rendering
             preview_html = math_renderer.render_math_html(html_raw, str(self.tmp_dir), mode="html")
@@ -628,7 +874,7 @@ class LayoutEngine:
         # Set up _original_soup for debug HTML generation and add bid attributes
         # Use the same BID assignment logic as legacy preprocessing
         processed_html_for_bids = self._preprocess_html_for_measurement(html_content)
-        
+
         # Use structured parser with properly preprocessed HTML that has BIDs
         blocks = await parse_html_with_structured_layout(
             processed_html_for_bids,
@@ -637,27 +883,29 @@ class LayoutEngine:
             debug=self.debug,
             base_dir=str(self.base_dir)
         )
-        
-        # Build _original_soup from the MEASUREMENT version to ensure BID consistency
-        # IMPORTANT: Use the SAME HTML structure that was used for block creation
-        self._original_soup = BeautifulSoup(processed_html_for_bids, 'html.parser')
-        
-        # The BIDs are already assigned in processed_html_for_bids, so we don't need to add them again
+
+        # _original_soup was stored by _preprocess_html_for_measurement and is the
+        # very tree processed_html_for_bids was serialized from, so BIDs already
+        # match the blocks – no need to re-parse the string here.
 
         # Apply intelligent image scaling based on column context
+        image_srcs = []
         for block in blocks:
             if block.is_image():
                 logger.info(f"IMAGE BLOCK: src='{block.src}', content='{block.content}'")
+                image_srcs.append(block.src)
+        # Dimension probes are I/O bound and independent – warm the cache in parallel
+        self.image_scaler.image_cache.prewarm(image_srcs)
         blocks = self._apply_intelligent_image_scaling_to_blocks(blocks, str(temp_dir))
+        self.image_scaler.image_cache.flush()
 
         # Merge consecutive list items into text blocks
         blocks = self._merge_consecutive_lists(blocks)
         
         # --- Determine usable page height (slide height minus padding) ---
-        slide_height_px = self.css_parser.get_px_value('slide-height')
-        padding_px = self.css_parser.get_px_value('slide-padding')
-        
-        usable_height_px = slide_height_px - 2 * padding_px
+        slide_height_px = self._slide_height_px
+        padding_px = self._padding_px
+        usable_height_px = self._usable_height_px
         if usable_height_px <= 0:
             raise ValueError(f"❌ CSS theme '{self.theme}' has invalid dimensions: "
                            f"slide height {slide_height_px}px minus 2×{padding_px}px padding = {usable_height_px}px")
@@ -670,15 +918,14 @@ class LayoutEngine:
             # Use the already-rendered preview HTML (text fallbacks)
             debug_html = preview_html
 
-            paginated_html = self._generate_paginated_debug_html(pages, debug_html, temp_dir)
-                
             # Save to output directory for easy viewing
             current_working_dir = Path.cwd()
             output_dir = current_working_dir / "output"
             output_dir.mkdir(exist_ok=True)
             
+            # Stream straight to disk so the full preview is never held in memory
             with open(output_dir / f"paginated_slides_{self.theme}.html", "w", encoding='utf-8') as f:
-                f.write(paginated_html)
+                self._generate_paginated_debug_html(pages, debug_html, temp_dir, out=f)
                 
             logger.info(f"📄 Generated paginated HTML: output/paginated_slides_{self.theme}.html")
             logger.info(f"Layout engine created {len(pages)} pages:")
@@ -696,10 +943,8 @@ class LayoutEngine:
         This ensures the browser measures the same content that will be displayed.
         """
 
-        def process_list_content(match):
+        def process_list_content(list_tag, list_content):
             """Process a single list (ul or ol) and convert to formatted text with level information"""
-            list_tag = match.group(1).lower()  # 'ul' or 'ol'
-            list_content = match.group(2)
             
             # Extract list items with their nested structure
             items_with_levels = self._extract_list_items_with_levels(list_content, list_tag)
@@ -712,7 +957,7 @@ class LayoutEngine:
                     pass
             
             if not items_with_levels:
-                return match.group(0)  # Return original if no items found
+                return None  # Keep the original list if no items found
             
             # Format list items for PowerPoint (flat text with level metadata)
             formatted_items = []
@@ -742,168 +987,95 @@ class LayoutEngine:
         # JavaScript in layout_parser now skips caption creation when one
         # already exists, this will not cause duplicates in PPTX.
         # ------------------------------------------------------------
-        if self.debug:
-            try:
-                _soup = BeautifulSoup(processed_html, 'html.parser')
-                for _img in _soup.find_all('img'):
-                    cap_txt = _img.get('data-caption')
-                    if cap_txt and cap_txt.strip():
-                        nxt = _img.find_next_sibling()
-                        if not (nxt and getattr(nxt, 'get', lambda *_: None)('class') and 'figure-caption' in nxt['class']):
-                            cap_el = _soup.new_tag('p', **{'class': 'figure-caption'})
-                            cap_el.string = cap_txt
-                            _img.insert_after(cap_el)
-                processed_html = str(_soup)
-            except Exception:
-                pass  # Fail silently – preview captions are a convenience
-        
-        # Keep processing until no more top-level lists are found
-        max_iterations = 50  # Increased limit for complex documents with many lists
-        iteration = 0
+        if self.debug and 'data-caption' in processed_html:
+            def _add_caption(match):
+                cap_txt = unescape(match.group(1))
+                if not cap_txt.strip():
+                    return match.group(0)
+                return f'{match.group(0)}<p class="figure-caption">{escape(cap_txt, quote=False)}</p>'
+
+            processed_html = _IMG_CAPTION_RE.sub(_add_caption, processed_html)
         
+        # Parse once and rewrite each top-level list in the tree; nested lists
+        # are flattened by their outermost list and detached along with it.
+        soup = BeautifulSoup(processed_html, _FAST_PARSER)
+        list_elements = soup.find_all(_LIST_TAGS)
+
         if self.debug:
-            initial_list_count = len(re.findall(r'<(ul|ol)[^>]*>', processed_html, flags=re.IGNORECASE))
-            logger.info(f"🔄 Processing {initial_list_count} lists in HTML document...")
-        
-        while iteration < max_iterations:
-            # Find all list starts
-            list_starts = []
-            for match in re.finditer(r'<(ul|ol)[^>]*>', processed_html, flags=re.IGNORECASE):
-                list_starts.append((match.start(), match.end(), match.group(1).lower()))
-            
-            if not list_starts:
-                break
-                
-            # Process the first list with balanced tag matching
-            start_pos, tag_end_pos, list_tag = list_starts[0]
-            
-            # Find the matching closing tag using balanced counting
-            content_start = tag_end_pos
-            current_pos = content_start
-            depth = 1
-            
-            while current_pos < len(processed_html) and depth > 0:
-                # Look for opening or closing tags of the same type
-                open_pattern = f'<{list_tag}[^>]*>'
-                close_pattern = f'</{list_tag}>'
-                
-                next_open = re.search(open_pattern, processed_html[current_pos:], re.IGNORECASE)
-                next_close = re.search(close_pattern, processed_html[current_pos:], re.IGNORECASE)
-                
-                if next_close and (not next_open or next_close.start() < next_open.start()):
-                    # Found closing tag first
-                    depth -= 1
-                    if depth == 0:
-                        # This is our matching closing tag
-                        content_end = current_pos + next_close.start()
-                        tag_close_start = current_pos + next_close.start()
-                        tag_close_end = current_pos + next_close.end()
-                        break
-                    current_pos += next_close.end()
-                elif next_open:
-                    # Found opening tag first
-                    depth += 1
-                    current_pos += next_open.end()
-                else:
-                    # No more tags found
-                    content_end = len(processed_html)
-                    tag_close_start = len(processed_html)
-                    tag_close_end = len(processed_html)
-                    break
-            else:
-                # Reached end without finding balanced closing
-                content_end = len(processed_html)
-                tag_close_start = len(processed_html)
-                tag_close_end = len(processed_html)
-                
-            # Extract the balanced list content
-            list_content = processed_html[content_start:content_end]
-            
-            # Create a mock match object for the process_list_content function
-            class MockMatch:
-                def __init__(self, tag, content, full_match):
-                    self._tag = tag
-                    self._content = content
-                    self._full_match = full_match
-                    
-                def group(self, n):
-                    if n == 0:
-                        return self._full_match
-                    elif n == 1:
-                        return self._tag
-                    elif n == 2:
-                        return self._content
-                        
-            full_match = processed_html[start_pos:tag_close_end]
-            mock_match = MockMatch(list_tag, list_content, full_match)
-            
-            # Process this list
-            replacement = process_list_content(mock_match)
-            processed_html = (processed_html[:start_pos] + 
-                            replacement + 
-                            processed_html[tag_close_end:])
-            iteration += 1
+            logger.info(f"🔄 Processing {len(list_elements)} lists in HTML document...")
+
+        for list_el in list_elements:
+            if list_el.find_parent(_LIST_TAGS) is not None:
+                continue
+            replacement = process_list_content(list_el.name, list_el.decode_contents())
+            if replacement is not None:
+                list_el.replace_with(BeautifulSoup(replacement, 'html.parser'))
         
         # ------------------------------------------------------------------
         # 4) WYSIWYG SUPPORT – stamp every measurable element with bid
         # ------------------------------------------------------------------
-        soup = BeautifulSoup(processed_html, 'html.parser')
         bid_counter = 0
+        bid_index = {}
+        # Admonition internals are measured as part of their admonition; collect
+        # them in one selector pass instead of walking every element's parents
+        admonition_children = {id(el) for el in soup.select('.admonition *')}
         for el in soup.select('.slide *'):
             # Skip page-break markers or admonition internal children (only top-level)
             if el.has_attr('data-bid'):
+                bid_index.setdefault(el['data-bid'], el)
                 continue
-            skip = False
-            for parent in el.parents:
-                if parent.has_attr('class') and 'admonition' in parent.get('class', []):
-                    # If parent is admonition and it's not the same element, skip
-                    if parent != el:
-                        skip = True
-                        break
-            if skip:
+            if id(el) in admonition_children:
                 continue
-            el['data-bid'] = f'b{bid_counter}'
+            bid = f'b{bid_counter}'
+            el['data-bid'] = bid
+            bid_index.setdefault(bid, el)
             bid_counter += 1
 
-        # Save pristine soup for later DOM slicing in debug HTML
+        # Map every BID to the direct child of its (nearest) .slide in one
+        # top-down pass, so debug slicing never climbs parent chains
+        slide_roots = {}
+        for slide in soup.select('.slide'):
+            for root in slide.find_all(True, recursive=False):
+                if root.has_attr('data-bid'):
+                    slide_roots[root['data-bid']] = root
+                for el in root.find_all(attrs={'data-bid': True}):
+                    slide_roots[el['data-bid']] = root
+
+        # Save pristine soup (and its BID indexes) for later DOM slicing in debug HTML
         self._original_soup = soup
+        self._bid_index = bid_index
+        self._bid_slide_roots = slide_roots
 
         return str(soup)
     
     def _extract_list_items_with_levels(self, list_content, list_tag, base_level=0):
         """Extract list items and their nesting level using BeautifulSoup (robust)."""
 
-        soup = BeautifulSoup(list_content, 'html.parser')
-
         items_with_levels = []
 
         def _walk(list_element, level):
-            for li in list_element.find_all('li', recursive=False):
-                # capture text/html before any nested lists
-                parts = []
-                for child in li.contents:
-                    if child.name in ('ul', 'ol'):
-                        break
-                    parts.append(str(child))
-
-                combined = ''.join(parts)
+            # Filter direct children by tag name; find_all(recursive=False) is
+            # much slower for the same result
+            for li in [c for c in list_element.contents if c.name == 'li']:
+                # capture text/html before any nested lists. Children are serialized
+                # one by one on purpose: str() of a text node is its raw text, whereas
+                # decode_contents() would entity-escape it and change the cleaned result.
+                children = li.contents
+                nested_at = next((idx for idx, child in enumerate(children) if child.name in _LIST_TAGS),
+                                 len(children))
+                combined = ''.join(map(str, children[:nested_at]))
                 clean = self._clean_html_for_measurement(combined)
                 if clean.strip():
                     items_with_levels.append((clean, level))
 
                 # recurse into nested lists directly under this li
-                for sub in li.find_all(['ul', 'ol'], recursive=False):
+                for sub in [c for c in li.contents if c.name in _LIST_TAGS]:
                     _walk(sub, level + 1)
 
-        # Locate the correct root list element
-        if soup.name == list_tag:
-            # The soup itself is the correct list type
-            root = soup
-        else:
-            # For fragments, we need to wrap them to ensure we process ALL items
-            # Don't use soup.find() as it might find nested lists instead of the root
-            wrapped = f'<{list_tag}>' + list_content + f'</{list_tag}>'
-            root = BeautifulSoup(wrapped, 'html.parser').find(list_tag)
+        # Wrap the fragment in its list tag so ALL top-level items are processed
+        # (soup.find() on the bare fragment might find a nested list instead)
+        wrapped = f'<{list_tag}>' + list_content + f'</{list_tag}>'
+        root = BeautifulSoup(wrapped, _FAST_PARSER).find(list_tag)
 
         if root:
             _walk(root, base_level)
@@ -912,47 +1084,36 @@ class LayoutEngine:
 
     def _clean_html_for_measurement(self, text):
         """Clean HTML tags but preserve inline formatting for measurement."""
-        
-        # First, handle inline formatting tags that we want to preserve
-        # Convert them to a temporary format
-        text = re.sub(r'<(strong|b)(?:[^>]*)>(.*?)</\1>', r'**\2**', text, flags=re.IGNORECASE | re.DOTALL)
-        text = re.sub(r'<(em|i)(?:[^>]*)>(.*?)</\1>', r'*\2*', text, flags=re.IGNORECASE | re.DOTALL)
-        text = re.sub(r'<code(?:[^>]*)>(.*?)</code>', r'`\1`', text, flags=re.IGNORECASE | re.DOTALL)
-        text = re.sub(r'<mark(?:[^>]*)>(.*?)</mark>', r'==\1==', text, flags=re.IGNORECASE | re.DOTALL)
-        
-        # Remove all other HTML tags EXCEPT inline formatting we want to preserve
-        # Keep span/u/del/strong/em/i/b/code/mark tags with any attributes
-        text = re.sub(r'<(?!/?(?:span|u|del|strong|b|em|i|code|mark)\b)[^>]+>', '', text, flags=re.IGNORECASE)
-        
-        # Clean up whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
-        
-        # Convert back to HTML formatting tags
-        text = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', text)
-        text = re.sub(r'\*(.*?)\*', r'<em>\1</em>', text)
-        text = re.sub(r'`(.*?)`', r'<code>\1</code>', text)
-        text = re.sub(r'==(.*?)==', r'<mark>\1</mark>', text)
-        
-        return unescape(text)
+        return _clean_html_for_measurement(text)
 
     def _merge_consecutive_lists(self, blocks: List[Block]) -> List[Block]:
         """Merge consecutive list items into single text blocks."""
+        # Evaluate the predicate once per block; the structured parser wraps whole
+        # <ul>/<ol> elements, so most decks contain no bare <li> blocks at all.
+        list_item_flags = [block.is_list_item() for block in blocks]
+        if not any(list_item_flags):
+            return list(blocks)
+
         merged_blocks = []
         current_block = None
-        
-        for block in blocks:
-            if block.is_list_item():
+        parts = []  # contents of the current run, joined once when it ends
+
+        for is_list_item, block in zip(list_item_flags, blocks):
+            if is_list_item:
                 if current_block:
-                    current_block.content += " " + block.content
+                    parts.append(block.content)
                 else:
                     current_block = block
+                    parts = [block.content]
             else:
                 if current_block:
+                    current_block.content = " ".join(parts)
                     merged_blocks.append(current_block)
                     current_block = None
                 merged_blocks.append(block)
         
         if current_block:
+            current_block.content = " ".join(parts)
             merged_blocks.append(current_block)
         
         return merged_blocks 
@@ -974,188 +1135,293 @@ class LayoutEngine:
             logger.info(f"🔍 Applying intelligent image scaling to {len(blocks)} blocks...")
         
         # Track pagination context for accurate height constraints
-        usable_height = self.css_parser.get_px_value('slide-height') - 2 * self.css_parser.get_px_value('slide-padding')
+        usable_height = self._usable_height_px
+        # Scaled images may take up to 70% of the slide height
+        max_reasonable_height = usable_height * 0.70
+        content_width = self.image_scaler.content_width
+        get_aspect_ratio = self.image_scaler.image_cache.get_aspect_ratio
         
-        for i, block in enumerate(blocks):
-            if block.is_image() and hasattr(block, 'src'):
-                # Check if this block has scaling information
-                scale_x = getattr(block, 'scaleX', None)
-                scale_y = getattr(block, 'scaleY', None)
-                in_column = getattr(block, 'inColumn', None) == 'true'
+        # Collect: image blocks and their scaling attributes as aligned lists
+        image_indices = [i for i, block in enumerate(blocks) if block.is_image()]
+        image_blocks = [blocks[i] for i in image_indices]
+        scale_xs = [block.scaleX for block in image_blocks]
+        scale_ys = [block.scaleY for block in image_blocks]
+        in_columns = [block.inColumn == 'true' for block in image_blocks]
+
+        # Compute: base dimensions depend only on the image itself – the requested
+        # scale for scaled images, the natural size for auto-fit ones
+        calculate_dimensions = self.image_scaler.calculate_image_dimensions
+        get_dimensions = self.image_scaler.image_cache.get_dimensions
+        base_dims = [
+            calculate_dimensions(block.src, scale_x, scale_y, in_column=in_column,
+                                 parent_column_width=block.parentColumnWidth)
+            if scale_x or scale_y else get_dimensions(block.src)
+            for block, scale_x, scale_y, in_column in zip(image_blocks, scale_xs, scale_ys, in_columns)
+        ]
+
+        # Content height above an image, from the likely page start (the last h1
+        # before it): prefix sums over the incoming heights plus the resize deltas
+        # applied so far, which always land on earlier blocks in index order.
+        height_prefix = [0]
+        page_starts = []
+        last_h1_idx = 0
+        for idx, block in enumerate(blocks):
+            height_prefix.append(height_prefix[-1] + block.height)
+            page_starts.append(last_h1_idx)
+            if block.tag == 'h1':  # Major heading indicates likely page start
+                last_h1_idx = idx
+        resized_indices = []
+        resize_delta_prefix = [0]
+
+        def _content_above(i):
+            page_start_idx = page_starts[i]
+            applied = resize_delta_prefix[-1] - resize_delta_prefix[bisect_left(resized_indices, page_start_idx)]
+            return height_prefix[i] - height_prefix[page_start_idx] + applied
+
+        def _record_resize(i, height_delta):
+            resized_indices.append(i)
+            resize_delta_prefix.append(resize_delta_prefix[-1] + height_delta)
+
+        # Blocks below a resized image move with it up to the next page break, but
+        # only within the same column context (same parent column width, x within
+        # 5px). Column contexts and page-break boundaries are fixed, so they are
+        # encoded as arrays once, on the first resize.
+        shift_arrays = []
+
+        def _shift_following(i, height_delta):
+            if not shift_arrays:
+                column_codes = {}
+                col_ids = np.array([column_codes.setdefault(b.parentColumnWidth, len(column_codes))
+                                    for b in blocks], dtype=np.int64)
+                xs = np.array([b.x for b in blocks], dtype=np.float64)
+                # next_break[k] = index of the first page break at or after k
+                next_break = np.empty(len(blocks) + 1, dtype=np.int64)
+                next_break[-1] = len(blocks)
+                for k in range(len(blocks) - 1, -1, -1):
+                    next_break[k] = k if blocks[k].is_page_break() else next_break[k + 1]
+                shift_arrays.extend((col_ids, xs, next_break))
+            col_ids, xs, next_break = shift_arrays
+            start, end = i + 1, next_break[i + 1]
+            if start >= end:
+                return
+            same_column = (col_ids[start:end] == col_ids[i]) & (np.abs(xs[start:end] - xs[i]) <= 5)
+            for k in np.flatnonzero(same_column) + start:
+                blocks[k].y += height_delta
+
+        # Scatter: fit and write back in order, since every resize shifts the blocks below it
+        for i, block, scale_x, scale_y, in_column, (base_width, base_height) in zip(
+                image_indices, image_blocks, scale_xs, scale_ys, in_columns, base_dims):
+            if scale_x or scale_y:
+                # STEP 1: Requested percentage of available width (computed above)
+                initial_width, initial_height = base_width, base_height
                 
-                if scale_x or scale_y:
-                    # STEP 1: Apply requested percentage of available width
-                    parent_col_width = getattr(block, 'parentColumnWidth', None)
-                    initial_width, initial_height = self.image_scaler.calculate_image_dimensions(
-                        block.src, scale_x, scale_y, in_column=in_column, parent_column_width=parent_col_width
-                    )
+                if initial_width is not None and initial_height is not None:
+                    # STEP 2 & 3: Calculate available height more accurately
+                    # Content height from the likely page start (last h1) to this image
+                    content_above_height = _content_above(i)
+                    available_height = usable_height - content_above_height
                     
-                    if initial_width is not None and initial_height is not None:
-                        # STEP 2 & 3: Calculate available height more accurately
-                        # Look for natural page breaks (new headings) to determine page boundaries
-                        page_start_idx = 0
-                        for j in range(i-1, -1, -1):
-                            if blocks[j].tag == 'h1':  # Major heading indicates likely page start
-                                page_start_idx = j
-                                break
-                        
-                        # Calculate content height from likely page start to this image
-                        content_above_height = sum(b.height for b in blocks[page_start_idx:i])
-                        available_height = usable_height - content_above_height
-                        
-                        final_width = initial_width
-                        final_height = initial_height
-                        
-                        # STEP 4: Only constrain if image really exceeds reasonable bounds  
-                        # Be more generous with height constraints to avoid unnecessary scaling
-                        max_reasonable_height = usable_height * 0.70  # Allow up to 70% of slide height
-                        
-                        if initial_height > max_reasonable_height:
-                            # STEP 5: Apply height-constrained scaling
-                            original_width, original_height = self.image_scaler.image_cache.get_dimensions(block.src)
-                            if original_width and original_height:
-                                aspect_ratio = original_width / original_height
-                                
-                                # Use 70% of slide height as maximum, not available height
-                                final_height = max_reasonable_height
-                                final_width = final_height * aspect_ratio
-                                
-                                if self.debug:
-                                    original_scale = float(scale_x) if scale_x else float(scale_y)
-                                    new_scale = final_width / (self.image_scaler.content_width * (1 if not in_column else 0.5))
-                                    logger.info(f"📐 Height-constrained scaling for {block.src}:")
-                                    logger.info(f"   Original request: {original_scale*100}% -> {initial_width:.0f}x{initial_height:.0f}")
-                                    logger.info(f"   Max reasonable height: {max_reasonable_height:.0f}px")
-                                    logger.info(f"   Adjusted to: {new_scale*100:.1f}% -> {final_width:.0f}x{final_height:.0f}")
-                            else:
-                                if self.debug:
-                                    logger.warning(f"⚠️ Could not load image {block.src} for aspect ratio")
-                                # Fallback: use requested size but warn about potential overflow
-                                final_width = initial_width
-                                final_height = initial_height
-                        elif self.debug:
-                            # Image fits reasonably within slide bounds
-                            logger.info(f"📐 Keeping original scale for {block.src}: {final_width:.0f}x{final_height:.0f} (within {max_reasonable_height:.0f}px limit)")
-                        
-                        # STEP 6: Update block dimensions with final calculated values
-                        old_dims = f"{block.width}x{block.height}"
-                        # --- NEW: track original height before resizing ---
-                        original_height_px = block.height
-                        block.w = int(final_width)
-                        block.h = int(final_height)
-
-                        # --- NEW: shift subsequent blocks on the same logical slide ---
-                        height_delta = block.h - original_height_px  # positive: image became taller, negative: smaller
-                        if height_delta != 0:
-                            # Determine the column context of the current image (None if not in a column)
-                            current_parent_col_w = getattr(block, 'parentColumnWidth', None)
-                            current_col_x = block.x
-
-                            for k in range(i + 1, len(blocks)):
-                                next_block = blocks[k]
-                                if next_block.is_page_break():
-                                    break  # new slide, stop adjusting
-
-                                # Apply the shift ONLY to blocks that share the same column context.
-                                if (getattr(next_block, 'parentColumnWidth', None) == current_parent_col_w and
-                                    abs(next_block.x - current_col_x) <= 5):
-                                    next_block.y += height_delta
-
-                        # --- NEW: ensure debug HTML reflects the new dimensions ---
-                        if hasattr(self, '_original_soup') and hasattr(block, 'bid'):
-                            try:
-                                node = self._original_soup.select_one(f'[data-bid="{block.bid}"]')
-                                if node and node.name == 'img':
-                                    node['width'] = str(block.w)
-                                    node['height'] = str(block.h)
-                            except Exception:
-                                pass
-                        
-                        context = "column" if in_column else "full-width"
-                        constraint_type = "height-constrained" if initial_height > max_reasonable_height else "original-scale"
-                        if self.debug:
-                            logger.info(f"📐 Scaled block {block.src}: {old_dims} -> {final_width:.0f}x{final_height:.0f} ({context}, {constraint_type})")
-                    elif self.debug:
-                        logger.warning(f"⚠️ Failed to calculate dimensions for {block.src}")
-                elif block.is_image():
-                    # AUTO-FIT when no data-scale-x / data-scale-y is present
+                    final_width = initial_width
+                    final_height = initial_height
                     
-                    # 1. Calculate available width (respecting columns)
-                    available_w = (block.parentColumnWidth
-                                   if getattr(block, 'parentColumnWidth', None)
-                                   else self.image_scaler.content_width) * 0.95
-
-                    # 2. Estimate available HEIGHT on *this* page so far
-                    #    Approximate page start = last major heading (h1) before this image
-                    page_start_idx = 0
-                    for j in range(i-1, -1, -1):
-                        if blocks[j].tag == 'h1':
-                            page_start_idx = j
-                            break
-
-                    content_above_height = sum(b.height for b in blocks[page_start_idx:i])
-                    available_h = max(0, usable_height - content_above_height) * 0.95
-
-                    original_w, original_h = self.image_scaler.image_cache.get_dimensions(block.src)
-                    if original_w is None or original_h is None:
-                        if self.debug:
-                            logger.warning(f"⚠️ Auto-fit failed to read image size for {block.src}")
-                        continue
+                    # STEP 4: Only constrain if image really exceeds reasonable bounds  
+                    # Be more generous with height constraints to avoid unnecessary scaling
+                    if initial_height > max_reasonable_height:
+                        # STEP 5: Apply height-constrained scaling
+                        aspect_ratio = get_aspect_ratio(block.src)
+                        if aspect_ratio:
+                            # Use 70% of slide height as maximum, not available height
+                            final_height = max_reasonable_height
+                            final_width = final_height * aspect_ratio
+                            
+                            if self.debug:
+                                original_scale = float(scale_x) if scale_x else float(scale_y)
+                                new_scale = final_width / (content_width * (1 if not in_column else 0.5))
+                                logger.info(f"📐 Height-constrained scaling for {block.src}:")
+                                logger.info(f"   Original request: {original_scale*100}% -> {initial_width:.0f}x{initial_height:.0f}")
+                                logger.info(f"   Max reasonable height: {max_reasonable_height:.0f}px")
+                                logger.info(f"   Adjusted to: {new_scale*100:.1f}% -> {final_width:.0f}x{final_height:.0f}")
+                        else:
+                            if self.debug:
+                                logger.warning(f"⚠️ Could not load image {block.src} for aspect ratio")
+                            # Fallback: use requested size but warn about potential overflow
+                            final_width = initial_width
+                            final_height = initial_height
+                    elif self.debug:
+                        # Image fits reasonably within slide bounds
+                        logger.info(f"📐 Keeping original scale for {block.src}: {final_width:.0f}x{final_height:.0f} (within {max_reasonable_height:.0f}px limit)")
                     
-                    # If image already fits, no scaling needed
-                    if original_w <= available_w and original_h <= available_h:
-                        continue
-
-                    # 3. Calculate shrink ratio for both axes and pick the smallest
-                    ratio_w = available_w / original_w if original_w > 0 else 1
-                    ratio_h = available_h / original_h if original_h > 0 else 1
-                    ratio = min(ratio_w, ratio_h, 1) # Use min to guarantee fit, cap at 1 (no enlarging)
-
-                    # 4. Apply final dimensions to block
-                    # Track original height before resizing so we can shift following blocks
-                    original_height_px = block.h
-                    block.w = int(original_w * ratio)
-                    block.h = int(original_h * ratio)
-
-                    # Shift subsequent blocks to compensate for the change in image height
-                    height_delta = block.h - original_height_px
+                    # STEP 6: Update block dimensions with final calculated values
+                    old_dims = f"{block.width}x{block.height}"
+                    # --- NEW: track original height before resizing ---
+                    original_height_px = block.height
+                    block.w = int(final_width)
+                    block.h = int(final_height)
+
+                    # --- NEW: shift subsequent blocks on the same logical slide ---
+                    height_delta = block.h - original_height_px  # positive: image became taller, negative: smaller
                     if height_delta != 0:
-                        current_parent_col_w = getattr(block, 'parentColumnWidth', None)
-                        current_col_x = block.x
-                        for k in range(i + 1, len(blocks)):
-                            next_block = blocks[k]
-                            if next_block.is_page_break():
-                                break
-                            if (getattr(next_block, 'parentColumnWidth', None) == current_parent_col_w and
-                                abs(next_block.x - current_col_x) <= 5):
-                                next_block.y += height_delta
-
-                    # Ensure the corresponding <img> in the debug HTML reflects new size
-                    if hasattr(self, '_original_soup') and hasattr(block, 'bid'):
-                        try:
-                            node = self._original_soup.select_one(f'[data-bid="{block.bid}"]')
-                            if node and node.name == 'img':
-                                node['width'] = str(block.w)
-                                node['height'] = str(block.h)
-                        except Exception:
-                            pass
+                        _record_resize(i, height_delta)
+                        _shift_following(i, height_delta)
+
+                    # --- NEW: ensure debug HTML reflects the new dimensions ---
+                    node = self._bid_index.get(block.bid)
+                    if node is not None and node.name == 'img':
+                        node['width'] = str(block.w)
+                        node['height'] = str(block.h)
+                    
+                    context = "column" if in_column else "full-width"
+                    constraint_type = "height-constrained" if initial_height > max_reasonable_height else "original-scale"
+                    if self.debug:
+                        logger.info(f"📐 Scaled block {block.src}: {old_dims} -> {final_width:.0f}x{final_height:.0f} ({context}, {constraint_type})")
+                elif self.debug:
+                    logger.warning(f"⚠️ Failed to calculate dimensions for {block.src}")
+            else:
+                # AUTO-FIT when no data-scale-x / data-scale-y is present
+                
+                # 1. Calculate available width (respecting columns)
+                available_w = (block.parentColumnWidth or content_width) * 0.95
+
+                # 2. Estimate available HEIGHT on *this* page so far
+                #    Approximate page start = last major heading (h1) before this image
+                content_above_height = _content_above(i)
+                available_h = max(0, usable_height - content_above_height) * 0.95
 
+                original_w, original_h = base_width, base_height
+                if original_w is None or original_h is None:
                     if self.debug:
-                        context = "column" if getattr(block, 'inColumn', None) == "true" else "full-width"
-                        logger.info(f"🖼️  Auto-fit {block.src} ({context}): "
-                                    f"{original_w}x{original_h} → {block.w}x{block.h} ({ratio*100:.1f}%)")
-        
+                        logger.warning(f"⚠️ Auto-fit failed to read image size for {block.src}")
+                    continue
+                
+                # If image already fits, no scaling needed
+                if original_w <= available_w and original_h <= available_h:
+                    continue
+
+                # 3. Calculate shrink ratio for both axes and pick the smallest
+                ratio_w = available_w / original_w if original_w > 0 else 1
+                ratio_h = available_h / original_h if original_h > 0 else 1
+                ratio = min(ratio_w, ratio_h, 1) # Use min to guarantee fit, cap at 1 (no enlarging)
+
+                # 4. Apply final dimensions to block
+                # Track original height before resizing so we can shift following blocks
+                original_height_px = block.h
+                block.w = int(original_w * ratio)
+                block.h = int(original_h * ratio)
+
+                # Shift subsequent blocks to compensate for the change in image height
+                height_delta = block.h - original_height_px
+                if height_delta != 0:
+                    _record_resize(i, height_delta)
+                    _shift_following(i, height_delta)
+
+                # Ensure the corresponding <img> in the debug HTML reflects new size
+                node = self._bid_index.get(block.bid)
+                if node is not None and node.name == 'img':
+                    node['width'] = str(block.w)
+                    node['height'] = str(block.h)
+
+                if self.debug:
+                    context = "column" if getattr(block, 'inColumn', None) == "true" else "full-width"
+                    logger.info(f"🖼️  Auto-fit {block.src} ({context}): "
+                                f"{original_w}x{original_h} → {block.w}x{block.h} ({ratio*100:.1f}%)")
+    
         return blocks
 
-    def _generate_paginated_debug_html(self, pages: List[List[Block]], processed_html: str, temp_dir: str) -> str:
-        """Generate HTML showing content split across actual slide pages."""
+    def _generate_paginated_debug_html(self, pages: List[List[Block]], processed_html: str, temp_dir: str,
+                                       out: Optional[TextIO] = None) -> Optional[str]:
+        """Generate HTML showing content split across actual slide pages.
+
+        If *out* is given, each fragment is written to it as soon as it is
+        produced and ``None`` is returned; otherwise the full HTML string is
+        returned.
+        """
         
         # Get both theme CSS and HTML-specific styles (for columns, admonitions, etc.)
         theme_css = get_css(self.theme)
         from .layout_parser import HTML_SPECIFIC_CSS
         css_content = theme_css + "\n" + HTML_SPECIFIC_CSS
 
-        html_parts = [
+        if out is None:
+            html_parts = []
+            emit = html_parts.append
+        else:
+            def emit(fragment, _write=out.write):
+                _write(fragment)
+                _write("\n")
+
+        # Images are embedded per page fragment with one regex pass over its
+        # <img> tags. Bind the helpers used per image to locals once.
+        search_src = _SRC_ATTR_RE.search
+        path_exists = os.path.exists
+        path_join = os.path.join
+        path_abspath = os.path.abspath
+        guess_type = mimetypes.guess_type
+        b64encode = base64.b64encode
+        base_dir = temp_dir or ""
+        data_uri_cache = self._img_data_uri_cache
+
+        def _embed_img(match):
+            img_html = match.group(0)
+            src_match = search_src(img_html)
+            if not src_match:
+                return img_html
+            src = unescape(src_match.group(1))
+            if src.startswith("data:"):
+                return img_html  # already embedded
+            # Resolve file path
+            if src.startswith("file://"):
+                file_path = src[7:]
+            else:
+                file_path = path_join(base_dir, src)
+                if not path_exists(file_path):
+                    file_path = path_abspath(src)
+            if not path_exists(file_path):
+                return img_html
+            try:
+                # The same image often appears on many slides – encode each file once
+                cache_key = (os.path.realpath(file_path), os.path.getmtime(file_path))
+                data_uri = data_uri_cache.get(cache_key)
+                if data_uri is None:
+                    mime, _ = guess_type(file_path)
+                    if not mime:
+                        mime = "image/png"
+                    with open(file_path, "rb") as fh:
+                        b64 = b64encode(fh.read()).decode()
+                    data_uri = data_uri_cache[cache_key] = f"data:{mime};base64,{b64}"
+            except Exception:
+                return img_html
+            return img_html[:src_match.start(1)] + data_uri + img_html[src_match.end(1):]
+
+        def _beautify_list(match):
+            """Render a <p data-list-levels> paragraph as indented bullet lines."""
+            attrs, levels_attr, raw_html = match.groups()
+            try:
+                levels = [int(x) for x in levels_attr.split(',')]
+            except ValueError:
+                return match.group(0)
+            type_match = _LIST_TYPE_ATTR_RE.search(attrs)
+            list_type = type_match.group(1) if type_match else 'ul'
+            # counters per nesting level for ordered lists (index = level)
+            counters = []
+            # split on any <br>, <br/>, or <br /> (case-insensitive)
+            segments = [seg for seg in _BR_TAG_RE.split(raw_html) if seg.strip()]
+            new_html_parts = []
+            for seg_idx, seg in enumerate(segments):
+                level = levels[seg_idx] if seg_idx < len(levels) else 0
+                if list_type == 'ol':
+                    # drop deeper level counters, open missing levels at 0
+                    del counters[level + 1:]
+                    counters.extend([0] * (level + 1 - len(counters)))
+                    counters[level] += 1
+                    bullet = f"{counters[level]}."
+                else:
+                    bullet = '•'
+                indent = 20 * level
+                # U+00A0 rather than &nbsp; – the serialized form of the preview
+                new_html_parts.append(f'<span class="dbg-list" style="margin-left:{indent}px">{bullet}\xa0{seg.strip()}</span>')
+            return f'<p{attrs}>' + ''.join(new_html_parts) + '</p>'
+
+        for fragment in (
             "<!DOCTYPE html>",
             "<html lang=\"en\">",
             "<head>",
@@ -1170,97 +1436,40 @@ class LayoutEngine:
             "</style>",
             "</head>",
             "<body>"
-        ]
+        ):
+            emit(fragment)
 
         # Build HTML based on the actual paginated blocks structure
         for page_idx, page_blocks in enumerate(pages, start=1):
             if not page_blocks:
                 continue
                 
-            html_parts.append('<hr style="border:2px dashed #999;margin:40px 0;">')
+            emit('<hr style="border:2px dashed #999;margin:40px 0;">')
             
             # Check if this is a divider slide
             is_divider = _is_divider_slide(page_blocks)
             slide_class = "slide divider" if is_divider else "slide"
             
-            html_parts.append(f'<div class="{slide_class}" id="slide-{page_idx}" data-idx="{page_idx}">')
+            emit(f'<div class="{slide_class}" id="slide-{page_idx}" data-idx="{page_idx}">')
             
             # Use WYSIWYG slice – copy original DOM nodes for this page
             bids_this_page = [blk.bid for blk in page_blocks if hasattr(blk, 'bid')]
             page_html = self._slice_dom_for_page(bids_this_page)
 
             # ---- Beautify lists for debug view ----
-            try:
-                soup_page = BeautifulSoup(page_html, 'html.parser')
-                for p in soup_page.select('p[data-list-levels]'):
-                    levels = [int(x) for x in p['data-list-levels'].split(',')]
-                    list_type = p.get('data-list-type', 'ul')
-                    # counters per nesting level for ordered lists
-                    counters = {}
-                    raw_html = p.decode_contents()
-                    # split on any <br>, <br/>, or <br /> (case-insensitive)
-                    segments = [seg for seg in re.split(r'<br[^>]*>', raw_html, flags=re.IGNORECASE) if seg.strip()]
-                    new_html_parts = []
-                    for seg_idx, seg in enumerate(segments):
-                        level = levels[seg_idx] if seg_idx < len(levels) else 0
-                        if list_type == 'ol':
-                            # update counter for this level
-                            counters[level] = counters.get(level, 0) + 1
-                            # reset deeper level counters
-                            deeper = [k for k in counters.keys() if k > level]
-                            for k in deeper:
-                                del counters[k]
-                            bullet = f"{counters[level]}."
-                        else:
-                            bullet = '•'
-                        indent = 20 * level
-                        new_html_parts.append(f'<span class="dbg-list" style="margin-left:{indent}px">{bullet}&nbsp;{seg.strip()}</span>')
-                    p.clear()
-                    p.append(BeautifulSoup(''.join(new_html_parts), 'html.parser'))
-                page_html = str(soup_page)
-            except Exception:
-                pass
+            page_html = _LIST_PARAGRAPH_RE.sub(_beautify_list, page_html)
 
-            html_parts.append(page_html)
-            html_parts.append('</div>')  # close .slide
+            emit(_IMG_TAG_RE.sub(_embed_img, page_html))
+            emit('</div>')  # close .slide
 
         # Small CSS for debug bullets
-        # Update img src to point to embedded versions happened above.
-
-        html_parts.extend([
-            "<style>.dbg-list{display:block;text-indent:-1em;padding-left:1em;margin-left:20px;margin-top:0;margin-bottom:0;line-height:inherit;}</style>",
-            "</body>", "</html>"])
-
-        paginated_html = "\n".join(html_parts)
-
-        # Embed images in the generated HTML
-        soup_embed = BeautifulSoup(paginated_html, "html.parser")
-        for img_tag in soup_embed.find_all("img"):
-            src = img_tag.get("src", "")
-            if src.startswith("data:"):
-                continue  # already embedded
-            # Resolve file path
-            if src.startswith("file://"):
-                file_path = src[7:]
-            else:
-                file_path = os.path.join(temp_dir or "", src)
-                if not os.path.exists(file_path):
-                    file_path = os.path.abspath(src)
-            if not os.path.exists(file_path):
-                continue
-            try:
-                mime, _ = mimetypes.guess_type(file_path)
-                if not mime:
-                    mime = "image/png"
-                with open(file_path, "rb") as fh:
-                    b64 = base64.b64encode(fh.read()).decode()
-                img_tag["src"] = f"data:{mime};base64,{b64}"
-            except Exception:
-                pass
-
-        paginated_html = str(soup_embed)
+        emit("<style>.dbg-list{display:block;text-indent:-1em;padding-left:1em;margin-left:20px;margin-top:0;margin-bottom:0;line-height:inherit;}</style>")
+        emit("</body>")
+        emit("</html>")
 
-        return paginated_html
+        if out is not None:
+            return None
+        return "\n".join(html_parts)
     
     def _slice_dom_for_page(self, bids):
         """Copy the minimal DOM subtrees that contain all bids, preserving wrappers
@@ -1268,23 +1477,17 @@ class LayoutEngine:
         if not hasattr(self, '_original_soup') or self._original_soup is None:
             return ''
 
-        src = self._original_soup
+        slide_roots = self._bid_slide_roots
         copied_roots = []        # original nodes that will be deep-copied once
         copied_root_ids = set()  # use id() to avoid duplicates
 
         for bid in bids:
             if not bid:
                 continue
-            node = src.select_one(f'[data-bid="{bid}"]')
-            if not node:
+            # direct child of the slide containing this bid (cached at stamping)
+            anc = slide_roots.get(bid)
+            if anc is None:
                 continue
-
-            # climb until parent is the slide container (has class "slide")
-            anc = node
-            while anc.parent and not (anc.parent.has_attr('class') and 'slide' in anc.parent['class']):
-                anc = anc.parent
-
-            # anc is now direct child of slide (or node itself if already)
             if id(anc) not in copied_root_ids:
                 copied_roots.append(anc)
                 copied_root_ids.add(id(anc))
@@ -3,14 +3,18 @@
 Layout parser for converting HTML to Block objects with precise measurements.
 """
 
-import json
+import asyncio
+import atexit
 import logging
 import os
 import re
+import shutil
+import subprocess
+import sys
+import tempfile
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Iterator
 
-from bs4 import BeautifulSoup
 from pyppeteer import launch
 
 from .css_utils import CSSParser
@@ -19,6 +23,200 @@ from .theme_loader import get_css
 
 logger = logging.getLogger(__name__)
 
+# Heading tag in serialized HTML, data-bid attribute values, and BID numbers
+_HTAG_RE = re.compile(r'<(h[1-6])', re.IGNORECASE)
+_BID_RE = re.compile(r'data-bid="([^"]+)"')
+_BID_NUM_RE = re.compile(r'b(\d+)')
+
+# Default tag for each pptx-box type when the box has no originalTag
+_TAG_MAP = {
+    'heading': 'h1',  # Default, but will be overridden by originalTag
+    'text': 'p',
+    'image': 'img',
+    'table': 'table',
+    'list': 'ul',
+    'quote': 'blockquote',
+    'code': 'pre'
+}
+
+
+def _first_bid(html: str) -> Optional[str]:
+    """First non-empty ``data-bid`` value in *html*, or None."""
+    _, found, rest = html.partition('data-bid="')
+    if not found:
+        return None
+    bid, closed, _ = rest.partition('"')
+    if closed and bid:
+        return bid
+    # Empty or unterminated first attribute – let the regex find a later one
+    bid_match = _BID_RE.search(html)
+    return bid_match.group(1) if bid_match else None
+
+
+def _finish_image_block(block: Block, content: Dict[str, Any], shared: Dict) -> None:
+    """Copy image source and scaling data onto an image block."""
+    get = content.get
+    block.src = get('src')
+    block.scaleX = get('scaleX')
+    block.scaleY = get('scaleY')
+    block.scaleType = get('scaleType')
+    block.inColumn = get('inColumn')
+
+
+def _finish_table_block(block: Block, content: Dict[str, Any], shared: Dict) -> None:
+    """Copy measured column widths onto a table block, sharing equal lists."""
+    if 'tableColumnWidths' in content:
+        widths = content['tableColumnWidths']
+        if widths:
+            widths = shared.setdefault(tuple(widths), widths)
+        block.table_column_widths = widths
+
+
+# Per content-type hooks run after a Block is built; other types need none
+_BLOCK_FINISHERS = {
+    'image': _finish_image_block,
+    'table': _finish_table_block,
+}
+
+
+def _intern(value):
+    """Intern tag/class strings, which repeat across every block of a deck."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class _BrowserPool:
+    """
+    Lazily launched Chromium instance, and a bounded pool of its pages,
+    shared by every StructuredLayoutParser.
+    
+    A pyppeteer connection is bound to the event loop that launched it, so a
+    call from a new loop (e.g. a later ``asyncio.run``) terminates the stale
+    process and launches a fresh one. Callers that own the loop should await
+    :func:`close_shared_browser` before it finishes. pyppeteer's own atexit
+    hook needs the (by then closed) launch loop, so the browser is launched
+    with ``autoClose=False`` and an atexit hook that needs no loop kills
+    whatever is left.
+    
+    At most ``_MAX_PAGES`` pages are open at once; released pages go back to
+    an idle list and are reused by later parses until the browser goes away.
+    """
+    
+    _LAUNCH_ARGS = [
+        '--allow-file-access-from-files',
+        '--disable-web-security',
+        '--allow-file-access'
+    ]
+    _MAX_PAGES = 4
+    
+    def __init__(self):
+        self._browser = None
+        self._profile_dir = None
+        self._loop = None
+        self._lock = None
+        self._page_slots = None
+        self._idle_pages = []
+        self._page_viewports = {}  # open page -> viewport last applied to it
+        atexit.register(self._terminate)
+    
+    def _bind_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._terminate()
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._page_slots = asyncio.Semaphore(self._MAX_PAGES)
+    
+    async def get_browser(self):
+        """Return the shared browser for the running loop, launching it on first use."""
+        self._bind_loop()
+        async with self._lock:
+            if self._browser is not None and not self._is_alive(self._browser):
+                logger.warning("Shared Chromium instance died; relaunching")
+                self._terminate()
+            if self._browser is None:
+                self._profile_dir = tempfile.mkdtemp(prefix='slidegen_chrome_')
+                self._browser = await launch(args=self._LAUNCH_ARGS, autoClose=False,
+                                             userDataDir=self._profile_dir)
+        return self._browser
+    
+    async def acquire_page(self, viewport: Dict[str, Any]):
+        """Return an idle page sized to *viewport*, waiting while all pages are busy."""
+        self._bind_loop()
+        await self._page_slots.acquire()
+        try:
+            try:
+                page = await self._prepare_page(viewport)
+            except Exception as e:
+                # A browser whose connection dropped fails here, not on launch;
+                # relaunch it and try once more
+                logger.warning(f"Shared Chromium stopped responding ({e}); relaunching")
+                self._terminate()
+                page = await self._prepare_page(viewport)
+        except BaseException:
+            self._page_slots.release()
+            raise
+        return page
+    
+    async def _prepare_page(self, viewport: Dict[str, Any]):
+        browser = await self.get_browser()
+        page = self._idle_pages.pop() if self._idle_pages else await browser.newPage()
+        if self._page_viewports.get(page) != viewport:
+            await page.setViewport(viewport)
+        self._page_viewports[page] = viewport
+        return page
+    
+    def release_page(self, page) -> None:
+        """Hand *page* back; closed pages and pages of a replaced browser are dropped."""
+        if page in self._page_viewports and not page.isClosed():
+            self._idle_pages.append(page)
+        else:
+            self._page_viewports.pop(page, None)
+        self._page_slots.release()
+    
+    async def shutdown(self) -> None:
+        """Close the shared browser and remove its profile directory."""
+        browser = self._browser
+        if browser is not None and self._loop is asyncio.get_running_loop() and self._is_alive(browser):
+            try:
+                await browser.close()
+            except Exception as e:
+                logger.debug(f"Closing shared Chromium failed, terminating it: {e}")
+        self._terminate()
+    
+    @staticmethod
+    def _is_alive(browser) -> bool:
+        # A dropped connection with a live process surfaces in acquire_page
+        process = browser.process
+        return process is None or process.poll() is None
+    
+    def _terminate(self) -> None:
+        """Kill the browser process, wait for it and delete its profile; needs no loop."""
+        browser, profile_dir = self._browser, self._profile_dir
+        self._browser = self._profile_dir = None
+        self._idle_pages = []
+        self._page_viewports = {}
+        if browser is not None:
+            process = browser.process
+            if process is not None:
+                if process.poll() is None:
+                    process.terminate()
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+        if profile_dir is not None:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+
+
+_BROWSER_POOL = _BrowserPool()
+
+
+async def close_shared_browser() -> None:
+    """Close the Chromium instance shared by the layout parsers, if any."""
+    await _BROWSER_POOL.shutdown()
+
+
 # HTML-specific CSS that doesn't affect presentation output
 # These styles are hardcoded here to keep theme CSS files focused on presentation-affecting properties
 HTML_SPECIFIC_CSS = """
@@ -160,8 +358,7 @@ class StructuredLayoutParser:
     Parser that uses pptx-box approach for structured HTML parsing.
     
     This eliminates most regex parsing by having Puppeteer wrap elements
-    in structured containers with layout data, then using BeautifulSoup
-    to extract this information.
+    in structured containers and return their layout data directly.
     """
     
     def __init__(self, theme: str, base_dir: Path, debug: bool = False):
@@ -170,6 +367,14 @@ class StructuredLayoutParser:
         self.base_dir = base_dir
         # Use centralized CSS parsing
         self.css_parser = CSSParser(theme)
+        # Slide dimensions from the CSS theme, applied to each pooled page
+        self._viewport = {
+            'width': self.css_parser.get_px_value('slide-width'),
+            'height': self.css_parser.get_px_value('slide-height')
+        }
+        # Combine hardcoded HTML-specific CSS with theme CSS once per parser
+        # Put hardcoded CSS first so theme CSS can override presentation-affecting properties
+        self._combined_css = HTML_SPECIFIC_CSS + "\n" + get_css(theme)
     
     async def parse_html_with_layout(self, html_content: str, temp_dir: Optional[str] = None) -> List[Dict[str, Any]]:
         """
@@ -183,27 +388,10 @@ class StructuredLayoutParser:
             List of structured layout elements
         """
         
-        # Get slide dimensions from CSS theme
-        viewport_width = self.css_parser.get_px_value('slide-width')
-        viewport_height = self.css_parser.get_px_value('slide-height')
-        
-        # Combine hardcoded HTML-specific CSS with theme CSS
-        # Put hardcoded CSS first so theme CSS can override presentation-affecting properties
-        theme_css = get_css(self.theme)
-        combined_css = HTML_SPECIFIC_CSS + "\n" + theme_css
+        combined_css = self._combined_css
         
         # Images referenced directly via file:// – no temp copies needed
         
-        browser = await launch(args=[
-            '--allow-file-access-from-files',
-            '--disable-web-security',
-            '--allow-file-access'
-        ])
-        page = await browser.newPage()
-        
-        # Set viewport size to match CSS theme dimensions
-        await page.setViewport({'width': viewport_width, 'height': viewport_height})
-        
         # Inject CSS into HTML content
         if '<head>' in html_content:
             # Insert CSS into existing head
@@ -217,43 +405,68 @@ class StructuredLayoutParser:
             else:
                 html_content = f'<html>{css_injection}<body>{html_content}</body></html>'
         
-        # Write HTML to temp file and load it
-        if temp_dir:
-            html_file_path = os.path.join(temp_dir, "structured_layout.html")
-            with open(html_file_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
+        page = await _BROWSER_POOL.acquire_page(self._viewport)
+        try:
+            # Write HTML to temp file and load it; goto gives the document a
+            # file:// origin for local images and waits for them to load
+            if temp_dir:
+                # A fresh name per call, so parses sharing temp_dir never load
+                # each other's document
+                fd, html_file_path = tempfile.mkstemp(dir=temp_dir, prefix='structured_layout_', suffix='.html')
+                try:
+                    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                        f.write(html_content)
+                    await page.goto(f'file://{html_file_path}')
+                finally:
+                    os.remove(html_file_path)
+            else:
+                await page.setContent(html_content)
             
-            await page.goto(f'file://{html_file_path}')
-        else:
-            await page.setContent(html_content)
-        
-        # Inject JavaScript to wrap elements in pptx-box containers
-        await page.evaluate(self._get_pptx_box_wrapper_script())
+            # Wrap elements in pptx-box containers; the script returns the layout
+            # records directly so nothing round-trips through serialized HTML
+            elements = await page.evaluate(self._get_pptx_box_wrapper_script())
+        finally:
+            _BROWSER_POOL.release_page(page)
         
-        # Get the modified HTML with pptx-box wrappers
-        structured_html = await page.content()
+        for element in elements:
+            get = element.get
+            element['x'], element['y'], element['width'], element['height'] = (
+                float(get('x') or 0), float(get('y') or 0),
+                float(get('width') or 0), float(get('height') or 0))
+            if element['column']:
+                element['column']['width'] = float(element['column']['width'] or 0)
+            # Siblings share a parent class; intern it once here for convert_to_blocks
+            parent = element['parent']
+            element['parent_class'] = _intern(parent.get('class')) if parent else None
         
-        await browser.close()
-        
-        # Parse the structured HTML using BeautifulSoup
-        return self._parse_structured_html(structured_html)
+        return elements
     
     def _get_pptx_box_wrapper_script(self) -> str:
         """
         JavaScript code to wrap HTML elements in pptx-box containers.
         
-        This script identifies renderable elements and wraps them with
-        structured containers containing layout data.
+        This script identifies renderable elements, wraps them in pptx-box
+        containers and returns one layout record per box.
         """
         return """
         () => {
-            let boxId = 0;
-            
-            // Helper to generate unique box IDs
-            function getNextBoxId() {
-                return 'pptx-box-' + (boxId++);
+            // Escape a text node the way innerHTML serializes it
+            function escapeText(text) {
+                return text.replace(/&/g, '&amp;').replace(/</g, '&lt;')
+                           .replace(/>/g, '&gt;').replace(/\\u00a0/g, '&nbsp;');
             }
             
+            // Box type for each tag name; anything else is text
+            const TAG_TO_TYPE = {
+                h1: 'heading', h2: 'heading', h3: 'heading',
+                h4: 'heading', h5: 'heading', h6: 'heading',
+                img: 'image',
+                table: 'table',
+                ul: 'list', ol: 'list',
+                blockquote: 'quote',
+                pre: 'code'
+            };
+            
             // Helper to determine element type
             function getElementType(el) {
                 const tagName = el.tagName.toLowerCase();
@@ -263,25 +476,7 @@ class StructuredLayoutParser:
                     return 'list';
                 }
                 
-                if (['h1', 'h2', 'h3', 'h4', 'h5', 'h6'].includes(tagName)) {
-                    return 'heading';
-                }
-                if (tagName === 'img') {
-                    return 'image';
-                }
-                if (tagName === 'table') {
-                    return 'table';
-                }
-                if (['ul', 'ol'].includes(tagName)) {
-                    return 'list';
-                }
-                if (tagName === 'blockquote') {
-                    return 'quote';
-                }
-                if (tagName === 'pre') {
-                    return 'code';
-                }
-                return 'text';
+                return TAG_TO_TYPE[tagName] || 'text';
             }
             
             // Helper to extract style information
@@ -413,29 +608,43 @@ class StructuredLayoutParser:
                         );
                         
                         directItems.forEach(li => {
-                            // Get the text content without nested lists
+                            // Serialize this item's own content in one pass over
+                            // its children, leaving out nested ul/ol elements
                             let itemContent = '';
                             let itemText = '';
+                            const nestedListsInOriginal = [];
                             
-                            // Clone the li element to manipulate
-                            const liClone = li.cloneNode(true);
-                            
-                            // Remove nested ul/ol elements to get just this item's content
-                            const nestedLists = liClone.querySelectorAll('ul, ol');
-                            nestedLists.forEach(nestedList => nestedList.remove());
-                            
-                            itemContent = liClone.innerHTML.trim();
-                            itemText = liClone.textContent.trim();
+                            for (const child of li.childNodes) {
+                                if (child.nodeType === Node.TEXT_NODE) {
+                                    itemContent += escapeText(child.nodeValue);
+                                    itemText += child.nodeValue;
+                                } else if (child.nodeType === Node.COMMENT_NODE) {
+                                    itemContent += '<!--' + child.nodeValue + '-->';
+                                } else if (child.nodeType === Node.ELEMENT_NODE) {
+                                    const childTag = child.tagName.toLowerCase();
+                                    if (childTag === 'ul' || childTag === 'ol') {
+                                        nestedListsInOriginal.push(child);
+                                    } else if (child.querySelector('ul, ol')) {
+                                        // Rare: a list nested deeper inside the item
+                                        const childClone = child.cloneNode(true);
+                                        childClone.querySelectorAll('ul, ol').forEach(nestedList => nestedList.remove());
+                                        itemContent += childClone.outerHTML;
+                                        itemText += childClone.textContent;
+                                    } else {
+                                        itemContent += child.outerHTML;
+                                        itemText += child.textContent;
+                                    }
+                                }
+                            }
                             
                             // Add this item
                             items.push({
-                                content: itemContent,
-                                text: itemText,
+                                content: itemContent.trim(),
+                                text: itemText.trim(),
                                 level: baseLevel
                             });
                             
                             // Process nested lists
-                            const nestedListsInOriginal = li.querySelectorAll(':scope > ul, :scope > ol');
                             nestedListsInOriginal.forEach(nestedList => {
                                 extractListItems(nestedList, baseLevel + 1);
                             });
@@ -458,10 +667,12 @@ class StructuredLayoutParser:
                 if (tagName === 'p' && el.querySelector('img.math-image.inline')) {
                     // This paragraph contains inline math images
                     // We need to preserve the HTML structure but ensure math images are handled correctly
-                    let processedHTML = el.innerHTML.trim();
+                    // Rewrite the images on a detached copy and serialize once,
+                    // rather than string-replacing each image in the paragraph HTML
+                    const elClone = el.cloneNode(true);
                     
                     // Find all inline math images and ensure they're properly formatted
-                    const mathImages = el.querySelectorAll('img.math-image.inline');
+                    const mathImages = elClone.querySelectorAll('img.math-image.inline');
                     mathImages.forEach(img => {
                         // Ensure the math image has all necessary attributes
                         const latex = img.getAttribute('data-latex') || img.getAttribute('alt') || '';
@@ -471,11 +682,20 @@ class StructuredLayoutParser:
                         const src = img.getAttribute('src') || '';
                         
                         // Create a properly formatted math image tag
-                        const mathImgHTML = `<img alt="${latex}" class="math-image inline" data-latex="${latex}" data-math-width="${width}" data-math-height="${height}" data-math-baseline="${baseline}" src="${src}" style="vertical-align: -${baseline}px;"/>`;
+                        const mathImg = document.createElement('img');
+                        mathImg.setAttribute('alt', latex);
+                        mathImg.setAttribute('class', 'math-image inline');
+                        mathImg.setAttribute('data-latex', latex);
+                        mathImg.setAttribute('data-math-width', width);
+                        mathImg.setAttribute('data-math-height', height);
+                        mathImg.setAttribute('data-math-baseline', baseline);
+                        mathImg.setAttribute('src', src);
+                        mathImg.setAttribute('style', `vertical-align: -${baseline}px;`);
                         
                         // Replace the original img tag with the properly formatted one
-                        processedHTML = processedHTML.replace(img.outerHTML, mathImgHTML);
+                        img.replaceWith(mathImg);
                     });
+                    const processedHTML = elClone.innerHTML.trim();
                     
                     return {
                         type: 'text',
@@ -517,7 +737,7 @@ class StructuredLayoutParser:
                 return captionEl;
             }
             
-            // Main function to wrap elements
+            // Main function to wrap elements; returns one record per box
             function wrapElementsInPptxBoxes() {
                 // First, create caption elements for images with captions
                 document.querySelectorAll('img[data-caption]').forEach(img => {
@@ -530,193 +750,140 @@ class StructuredLayoutParser:
                     }
                 });
                 
-                const elementsToWrap = document.querySelectorAll('.slide *, .page-break');
-                const processedElements = new Set();
-                
-                Array.from(elementsToWrap).forEach(el => {
-                    // Skip if already processed or is a child of processed element
-                    if (processedElements.has(el)) return;
+                // Phase 1 – pick the elements to box, without touching layout.
+                // Returns 'page-break', true (box it) or false (descend instead).
+                function boxKind(el) {
+                    const tagName = el.tagName.toLowerCase();
                     
                     // Skip script/style elements
-                    if (['script', 'style'].includes(el.tagName.toLowerCase())) return;
+                    if (tagName === 'script' || tagName === 'style') return false;
                     
                     // Handle page breaks specially
-                    if (el.classList.contains('page-break')) {
-                        const wrapper = document.createElement('div');
-                        wrapper.className = 'pptx-box page-break';
-                        wrapper.setAttribute('data-box-id', getNextBoxId());
-                        wrapper.setAttribute('data-type', 'page-break');
-                        wrapper.setAttribute('data-x', '0');
-                        wrapper.setAttribute('data-y', '0');
-                        wrapper.setAttribute('data-width', '0');
-                        wrapper.setAttribute('data-height', '0');
-                        wrapper.innerHTML = '<!-- slide -->';
-                        
-                        el.parentNode.replaceChild(wrapper, el);
-                        processedElements.add(wrapper);
-                        return;
-                    }
+                    if (el.classList.contains('page-break')) return 'page-break';
                     
                     // Skip empty non-img elements
-                    if (el.tagName.toLowerCase() !== 'img' && !el.textContent.trim()) return;
+                    if (tagName !== 'img' && !el.textContent.trim()) return false;
                     
                     // Skip li elements - process their parent ul/ol instead
-                    if (el.tagName.toLowerCase() === 'li') return;
+                    if (tagName === 'li') return false;
                     
                     // Skip column container divs - process their children
-                    if (el.className && (el.className.includes('columns') || el.className.includes('column'))) return;
+                    if (el.className && (el.className.includes('columns') || el.className.includes('column'))) return false;
                     
-                    // Check if this element is a child of an already processed element
-                    let isChild = false;
-                    for (const processed of processedElements) {
-                        if (processed.contains && processed.contains(el)) {
-                            isChild = true;
-                            break;
-                        }
+                    return true;
+                }
+                
+                // Pre-order walk in document order. Boxed subtrees are not
+                // descended into, so nothing needs an "inside a box" check.
+                const targets = [];
+                const stack = [[document.body, false]];
+                while (stack.length) {
+                    const [el, inSlide] = stack.pop();
+                    const isBox = inSlide || el.classList.contains('page-break');
+                    const kind = isBox && boxKind(el);
+                    if (kind) {
+                        const parent = el.parentElement;
+                        targets.push({
+                            el: el,
+                            kind: kind,
+                            parent: parent ? {tag: parent.tagName.toLowerCase(), class: parent.className || ''} : {}
+                        });
+                        continue;
+                    }
+                    
+                    const childInSlide = inSlide || el.classList.contains('slide');
+                    const children = el.children;
+                    for (let i = children.length - 1; i >= 0; i--) {
+                        stack.push([children[i], childInSlide]);
+                    }
+                }
+                
+                // Phase 2 – wrap every target. All DOM writes happen here, so
+                // the reads below see one settled layout instead of forcing a
+                // reflow per element; every box is measured inside its wrapper.
+                targets.forEach(target => {
+                    const el = target.el;
+                    const wrapper = document.createElement('div');
+                    if (target.kind === 'page-break') {
+                        wrapper.className = 'pptx-box page-break';
+                        wrapper.innerHTML = '<!-- slide -->';
+                        el.parentNode.replaceChild(wrapper, el);
+                        target.node = wrapper;
+                    } else {
+                        // Move the element itself into the wrapper; no subtree copy
+                        wrapper.className = 'pptx-box ' + getElementType(el);
+                        el.parentNode.insertBefore(wrapper, el);
+                        wrapper.appendChild(el);
+                        target.node = el;
+                    }
+                });
+                
+                // Phase 3 – measure and extract every box; box IDs follow
+                // document order, so the target index is the ID
+                const boxes = targets.map((target, index) => {
+                    const boxId = `pptx-box-${index}`;
+                    const el = target.node;
+                    if (target.kind === 'page-break') {
+                        return {
+                            box_id: boxId,
+                            type: 'page-break',
+                            x: 0, y: 0, width: 0, height: 0,
+                            style: {},
+                            parent: {},
+                            column: null,
+                            bid: null,
+                            original_class: null,
+                            content: {type: 'text', text: '', html: el.outerHTML}
+                        };
                     }
-                    if (isChild) return;
                     
                     // Extract layout and content information
                     const styleInfo = extractStyleInfo(el);
                     const content = extractContent(el);
                     const elementType = getElementType(el);
                     
-                    // Create pptx-box wrapper
-                    const wrapper = document.createElement('div');
-                    wrapper.className = 'pptx-box ' + elementType;
-                    
-                    // Add layout data attributes
-                    wrapper.setAttribute('data-box-id', getNextBoxId());
-                    wrapper.setAttribute('data-type', elementType);
-                    wrapper.setAttribute('data-x', styleInfo.x.toString());
-                    wrapper.setAttribute('data-y', styleInfo.y.toString());
-                    wrapper.setAttribute('data-width', styleInfo.width.toString());
-                    wrapper.setAttribute('data-height', styleInfo.height.toString());
-                    
-                    // Add style data attributes
-                    wrapper.setAttribute('data-font-size', styleInfo.fontSize);
-                    wrapper.setAttribute('data-font-weight', styleInfo.fontWeight);
-                    wrapper.setAttribute('data-font-style', styleInfo.fontStyle);
-                    wrapper.setAttribute('data-text-align', styleInfo.textAlign);
-                    wrapper.setAttribute('data-color', styleInfo.color);
-                    wrapper.setAttribute('data-background-color', styleInfo.backgroundColor);
-                    wrapper.setAttribute('data-line-height', styleInfo.lineHeight);
-                    
-                    // Add content data (as JSON for complex structures)
-                    wrapper.setAttribute('data-content', JSON.stringify(content));
-                    
-                    // Add parent information
-                    if (el.parentElement) {
-                        wrapper.setAttribute('data-parent-tag', el.parentElement.tagName.toLowerCase());
-                        wrapper.setAttribute('data-parent-class', el.parentElement.className || '');
-                    }
-                    
-                    // Add column information if in a column
+                    // Column information if in a column
+                    let column = null;
                     const parentColumn = el.closest('.column');
                     if (parentColumn) {
-                        const colRect = parentColumn.getBoundingClientRect();
-                        wrapper.setAttribute('data-column-width', colRect.width.toString());
-                        const mode = parentColumn.getAttribute('data-column-width');
-                        if (mode) wrapper.setAttribute('data-column-mode', mode);
-                    }
-                    
-                    // Add unique bid if present
-                    const bid = el.getAttribute('data-bid');
-                    if (bid) wrapper.setAttribute('data-bid', bid);
-                    
-                    // Preserve original element classes
-                    if (el.className) {
-                        wrapper.setAttribute('data-original-class', el.className);
+                        column = {
+                            width: parentColumn.getBoundingClientRect().width,
+                            mode: parentColumn.getAttribute('data-column-width') || null
+                        };
                     }
                     
-                    // Move the original element inside the wrapper
-                    wrapper.appendChild(el.cloneNode(true));
-                    
-                    // Replace original element with wrapper
-                    el.parentNode.replaceChild(wrapper, el);
-                    processedElements.add(wrapper);
+                    return {
+                        box_id: boxId,
+                        type: elementType,
+                        x: styleInfo.x,
+                        y: styleInfo.y,
+                        width: styleInfo.width,
+                        height: styleInfo.height,
+                        style: {
+                            fontSize: styleInfo.fontSize,
+                            fontWeight: styleInfo.fontWeight,
+                            fontStyle: styleInfo.fontStyle,
+                            textAlign: styleInfo.textAlign,
+                            color: styleInfo.color,
+                            backgroundColor: styleInfo.backgroundColor,
+                            lineHeight: styleInfo.lineHeight
+                        },
+                        parent: target.parent,
+                        column: column,
+                        bid: el.getAttribute('data-bid') || null,
+                        original_class: el.className || null,
+                        content: content
+                    };
                 });
+                
+                return boxes;
             }
             
-            // Execute the wrapping
-            wrapElementsInPptxBoxes();
+            // Execute the wrapping and hand the records back to Python
+            return wrapElementsInPptxBoxes();
         }
         """
     
-    def _parse_structured_html(self, html_content: str) -> List[Dict[str, Any]]:
-        """
-        Parse structured HTML with pptx-box wrappers using BeautifulSoup.
-        
-        Args:
-            html_content: HTML content with pptx-box wrappers
-            
-        Returns:
-            List of structured layout elements
-        """
-        soup = BeautifulSoup(html_content, 'html.parser')
-        elements = []
-        
-        # Find all pptx-box elements
-        pptx_boxes = soup.find_all(class_='pptx-box')
-        
-        for box in pptx_boxes:
-            try:
-                element_data = {
-                    'box_id': box.get('data-box-id'),
-                    'type': box.get('data-type'),
-                    'x': float(box.get('data-x') or 0),
-                    'y': float(box.get('data-y') or 0),
-                    'width': float(box.get('data-width') or 0),
-                    'height': float(box.get('data-height') or 0),
-                    'style': {
-                        'fontSize': box.get('data-font-size'),
-                        'fontWeight': box.get('data-font-weight'),
-                        'fontStyle': box.get('data-font-style'),
-                        'textAlign': box.get('data-text-align'),
-                        'color': box.get('data-color'),
-                        'backgroundColor': box.get('data-background-color'),
-                        'lineHeight': box.get('data-line-height')
-                    },
-                    'parent': {
-                        'tag': box.get('data-parent-tag'),
-                        'class': box.get('data-parent-class')
-                    },
-                    'column': {
-                        'width': float(box.get('data-column-width') or 0) if box.get('data-column-width') else None,
-                        'mode': box.get('data-column-mode')
-                    } if box.get('data-column-width') else None,
-                    'bid': box.get('data-bid'),
-                    'original_class': box.get('data-original-class')
-                }
-                
-                # Parse content data
-                content_json = box.get('data-content')
-                if content_json:
-                    try:
-                        element_data['content'] = json.loads(content_json)
-                    except json.JSONDecodeError:
-                        # Fallback to text content
-                        element_data['content'] = {
-                            'type': 'text',
-                            'text': box.get_text(strip=True),
-                            'html': str(box)
-                        }
-                else:
-                    element_data['content'] = {
-                        'type': 'text',
-                        'text': box.get_text(strip=True),
-                        'html': str(box)
-                    }
-                
-                elements.append(element_data)
-                
-            except (ValueError, TypeError) as e:
-                if self.debug:
-                    logger.warning(f"Failed to parse pptx-box element: {e}")
-                continue
-        
-        return elements
-    
     def convert_to_blocks(self, structured_elements: List[Dict[str, Any]]) -> List[Block]:
         """
         Convert structured elements to Block objects for compatibility.
@@ -727,66 +894,71 @@ class StructuredLayoutParser:
         Returns:
             List of Block objects
         """
-        blocks = []
+        return list(self._iter_blocks(structured_elements))
+    
+    def _iter_blocks(self, structured_elements: Iterable[Dict[str, Any]]) -> Iterator[Block]:
+        """Yield one Block per structured element, in order."""
+        block_count = 0
+        # Computed styles and table column widths repeat heavily across a deck;
+        # blocks share one object per distinct value (both are only ever read
+        # downstream). Keys are frozensets for styles and tuples for widths.
+        shared = {}
         
         for element in structured_elements:
+            element_type = element['type']
+            
             # Handle page breaks
-            if element['type'] == 'page-break':
+            if element_type == 'page-break':
                 block = Block(
                     tag='div',
                     content='<!-- slide -->',
                     x=0, y=0, w=0, h=0,
                     role='page_break'
                 )
-                blocks.append(block)
+                block_count += 1
+                yield block
                 continue
             
             # Initialize BID candidate
             block_bid_candidate = None
             
-            # Create Block object
+            # Create Block object; bind the per-element lookups once
+            element_get = element.get
             content = element['content']
+            content_get = content.get
+            content_type = content['type']
             
             # Determine tag name from type
-            tag_map = {
-                'heading': 'h1',  # Default, but will be overridden by originalTag
-                'text': 'p',
-                'image': 'img',
-                'table': 'table',
-                'list': 'ul',
-                'quote': 'blockquote',
-                'code': 'pre'
-            }
-            
-            tag = tag_map.get(element['type'], 'div')
+            tag = _TAG_MAP.get(element_type, 'div')
             
             # Use the original tag if available (more accurate than parsing HTML)
-            if 'originalTag' in content and content['originalTag']:
-                tag = content['originalTag']
-            elif element['type'] == 'heading':
+            original_tag = content_get('originalTag')
+            if original_tag:
+                tag = original_tag
+            elif element_type == 'heading':
                 # Fallback: try to determine heading level from HTML if originalTag is missing
-                html_content = content.get('html', '')
+                html_content = content_get('html', '')
                 if html_content:
-                    h_match = re.search(r'<(h[1-6])', html_content, re.IGNORECASE)
+                    h_match = _HTAG_RE.search(html_content)
                     if h_match:
                         tag = h_match.group(1).lower()
-                    # If no heading tag found in HTML, default to h1 (from tag_map)
+                    # If no heading tag found in HTML, default to h1 (from _TAG_MAP)
             
             # Extract text content
-            if content['type'] == 'text':
+            if content_type == 'text':
                 # Use HTML content to preserve inline formatting instead of plain text
-                text_content = content.get('html', content.get('text', ''))
+                text_content = content_get('html', content_get('text', ''))
                 # No need to re-parse tag from HTML since we have originalTag
-            elif content['type'] == 'image':
+            elif content_type == 'image':
                 # For images, preserve the original HTML to retain data attributes
-                text_content = content.get('html', content.get('alt', ''))
+                text_content = content_get('html', content_get('alt', ''))
             else:
-                text_content = content.get('text', str(content))
+                text_content = content_get('text', str(content))
             
             # Special handling for lists - convert to legacy format
-            if content['type'] == 'list' or tag in ['ul', 'ol']:
+            if content_type == 'list' or tag in ('ul', 'ol'):
                 # Convert list to legacy format that the PPTX renderer expects
-                list_items = content.get('items', [])
+                list_items = content_get('items', [])
                 
                 if list_items:
                     # Create formatted text content with levels, preserving HTML in items
@@ -804,7 +976,7 @@ class StructuredLayoutParser:
                         # Join with <br> instead of \n to preserve HTML structure
                         formatted_text = '<br>'.join(formatted_items)
                         level_data = ','.join(levels)
-                        list_type = content.get('listType', tag)
+                        list_type = content_get('listType', tag)
                         
                         # IMPORTANT: Set the correct tag for list blocks
                         tag = list_type
@@ -813,55 +985,67 @@ class StructuredLayoutParser:
                         text_content = f'<p data-list-levels="{level_data}" data-list-type="{list_type}">{formatted_text}</p>'
                         
                         # For lists, try to find a BID from the original HTML content
-                        list_html = content.get('html', '')
-                        bid_matches = re.findall(r'data-bid="([^"]+)"', list_html)
-                        if bid_matches:
+                        list_html = content_get('html', '')
+                        first_child_bid = _first_bid(list_html)
+                        if first_child_bid:
                             # Look for the parent container BID that should have been assigned by _preprocess_html_for_measurement
                             # The parent container for lists is typically a <p> with data-list-levels
                             # We need to check if this list corresponds to an existing container BID
                             # For now, use the first BID pattern found in children
-                            first_child_bid = bid_matches[0]
-                            # Extract the numeric part to construct the container BID
-                            bid_num_match = re.search(r'b(\d+)', first_child_bid)
-                            if bid_num_match:
+                            # Extract the numeric part to construct the container BID;
+                            # BIDs are stamped as b<digits>, anything else takes the regex path
+                            bid_digits = first_child_bid[1:]
+                            if first_child_bid.startswith('b') and bid_digits.isdecimal():
+                                bid_num = int(bid_digits)
+                            else:
+                                bid_num_match = _BID_NUM_RE.search(first_child_bid)
+                                bid_num = int(bid_num_match.group(1)) if bid_num_match else None
+                            if bid_num is not None:
                                 # The container typically has one less than the first child
-                                container_bid_num = max(0, int(bid_num_match.group(1)) - 1)
+                                container_bid_num = max(0, bid_num - 1)
                                 block_bid_candidate = f'b{container_bid_num}'
                             else:
                                 block_bid_candidate = first_child_bid
             
+            style = element_get('style', {})
+            if style:
+                try:
+                    style = shared.setdefault(frozenset(style.items()), style)
+                except TypeError:
+                    pass  # unhashable value – keep this block's own dict
+            
+            if 'parent_class' in element:
+                parent_class = element['parent_class']
+            else:
+                parent = element_get('parent')
+                parent_class = _intern(parent.get('class')) if parent else None
+            
             # Create block using from_element for better consistency
             element_dict = {
-                'tagName': tag,
+                'tagName': _intern(tag),
                 'textContent': text_content,
                 'x': int(element['x']),
                 'y': int(element['y']),
                 'width': int(element['width']),
                 'height': int(element['height']),
-                'className': element.get('original_class', '') or element.get('class', ''),
-                'style': element.get('style', {}),
-                'parentClassName': element['parent'].get('class') if element.get('parent') else None,
-                'bid': element.get('bid')
+                'className': _intern(element_get('original_class', '') or element_get('class', '')),
+                'style': style,
+                'parentClassName': parent_class,
+                'bid': element_get('bid')
             }
             
             block = Block.from_element(element_dict)
             
-            # Add additional attributes for images
-            if content['type'] == 'image':
-                block.src = content.get('src')
-                block.scaleX = content.get('scaleX')
-                block.scaleY = content.get('scaleY')
-                block.scaleType = content.get('scaleType')
-                block.inColumn = content.get('inColumn')
-            
-            # Add table column width information
-            if content['type'] == 'table' and 'tableColumnWidths' in content:
-                block.table_column_widths = content['tableColumnWidths']
+            # Add type-specific attributes (image data, table column widths)
+            finish_block = _BLOCK_FINISHERS.get(content_type)
+            if finish_block is not None:
+                finish_block(block, content, shared)
             
             # Add column information
-            if element.get('column'):
-                block.parentColumnWidth = element['column']['width']
-                block.columnMode = element['column']['mode']
+            column = element_get('column')
+            if column:
+                block.parentColumnWidth = column['width']
+                block.columnMode = column['mode']
             
             # Handle bid assignment if not already set by from_element
             if not block.bid:
@@ -870,16 +1054,14 @@ class StructuredLayoutParser:
                     block.bid = block_bid_candidate
                 else:
                     # Extract BID from HTML content if available
-                    html_content = content.get('html', '')
-                    bid_match = re.search(r'data-bid="([^"]+)"', html_content)
-                    if bid_match:
-                        block.bid = bid_match.group(1)
+                    html_bid = _first_bid(content_get('html', ''))
+                    if html_bid:
+                        block.bid = html_bid
                     else:
-                        block.bid = f"structured_{len(blocks)}"
+                        block.bid = f"structured_{block_count}"
             
-            blocks.append(block)
-        
-        return blocks
+            block_count += 1
+            yield block
     
 
 # Convenience function for backward compatibility
@@ -898,4 +1080,7 @@ async def parse_html_with_structured_layout(html_content: str, theme: str = "def
     """
     parser = StructuredLayoutParser(theme=theme, base_dir=Path(base_dir) if base_dir else Path.cwd(), debug=debug)
     structured_elements = await parser.parse_html_with_layout(html_content, temp_dir)
-    return parser.convert_to_blocks(structured_elements)
\ No newline at end of file
+    # Block conversion is pure Python; keep it off the event loop so other
+    # decks' browser work can proceed meanwhile
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, parser.convert_to_blocks, structured_elements)
\ No newline at end of file
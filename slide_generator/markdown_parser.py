@@ -1,6 +1,7 @@
 """
 Enhanced markdown parser with support for multiple page break formats.
 """
+import re
 from typing import List, Optional
 from markdown_it import MarkdownIt
 from pathlib import Path
@@ -113,8 +114,6 @@ class MarkdownParser:
         # POST-PROCESSING – stamp admonition boxes so downstream HTML / PPTX can
         # recognise them quickly (bonus: Puppeteer preview styling hook).
         # ------------------------------------------------------------------
-        import re
-
         def _add_data_attr(match):
             tag = match.group(0)
             # Skip if attribute already present (double-processing safeguard)
@@ -193,8 +192,6 @@ class MarkdownParser:
         # Validate fenced-block structure *before* we start mutating the text
         self._validate_fenced_blocks(markdown_text)
 
-        import re
-        
         # Strip out speaker-note lines (those starting with "???"). Actual
         # extraction happens later in `parse_with_page_breaks`, so here we just
         # remove them to keep the main markdown clean.
@@ -320,8 +317,7 @@ class MarkdownParser:
                         if line.startswith(':::column'):
                             # Detect optional width attribute – supports legacy ":::column{60%}" or
                             # attrs-style ":::column {width=60%}"
-                            import re as _re
-                            width_match = _re.match(r':::column\s+\{([^}]+)\}', line)
+                            width_match = re.match(r':::column\s+\{([^}]+)\}', line)
                             if width_match:
                                 pending_width = width_match.group(1).strip()
                             else:
@@ -444,7 +440,6 @@ class MarkdownParser:
         # After processing columns, mark images that are within column divs
         def mark_column_images(text: str) -> str:
             """Add data-in-column attribute to images within column divs"""
-            import re
             
             # Find all column divs and mark images within them
             def process_column_div(match):
@@ -4,6 +4,10 @@ Data models for the slide generator.
 from dataclasses import dataclass
 from typing import Dict, Optional
 
+_HEADING_TAGS = frozenset({'h1', 'h2', 'h3', 'h4', 'h5', 'h6'})
+_LIST_TAGS = frozenset({'ul', 'ol'})
+_CODE_TAGS = frozenset({'pre', 'code'})
+
 
 @dataclass
 class Block:
@@ -57,7 +61,7 @@ class Block:
     
     def is_heading(self):
         """Check if this block is a heading."""
-        return self.tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']
+        return self.tag in _HEADING_TAGS
     
     def is_paragraph(self):
         """Check if this block is a paragraph."""
@@ -65,11 +69,11 @@ class Block:
     
     def is_list(self):
         """Check if this block is a list."""
-        return self.tag in ['ul', 'ol']
+        return self.tag in _LIST_TAGS
     
     def is_code_block(self):
         """Check if this block is a code block."""
-        return self.tag in ['pre', 'code']
+        return self.tag in _CODE_TAGS
     
     def is_list_item(self):
         """Check if this block is a list item."""
@@ -23,6 +23,7 @@ from pathlib import Path
 # Local imports
 from .paths import prepare_workspace
 from .generator import SlideGenerator
+from .layout_parser import close_shared_browser
 from .markdown_parser import MarkdownParser
 
 logger = logging.getLogger(__name__)
@@ -551,7 +552,6 @@ class SlideNotebook:
             ```
         """
         import inspect
-        import re
         
         slide_id = str(uuid.uuid4())[:8]
         
@@ -856,8 +856,15 @@ class SlideNotebook:
 
             return asyncio.run(self.save(output_path))
         else:
-            # No event loop running, we can use asyncio.run
-            return asyncio.run(self.save(output_path))
+            # No event loop running, we can use asyncio.run. The loop is closed
+            # when it returns, so release the shared Chromium before that.
+            async def _save_and_close_browser():
+                try:
+                    return await self.save(output_path)
+                finally:
+                    await close_shared_browser()
+            
+            return asyncio.run(_save_and_close_browser())
 
     def preview_slide(self, index: int = -1):
         """Render **one** slide as HTML (default: the last one) – useful
@@ -1,7 +1,7 @@
 """Test layout engine functionality."""
 
 import pytest
-from slide_generator.layout_engine import LayoutEngine
+from slide_generator.layout_engine import LayoutEngine, paginate
 from slide_generator.models import Block
 
 
@@ -112,4 +112,124 @@ def test_pagination_with_height_limit():
     pages = engine.measure_and_paginate(markdown_text, page_height=300)  # Smaller page height
     
     # Should create multiple pages due to height constraints
-    assert len(pages) > 1 
\ No newline at end of file
+    assert len(pages) > 1 
+
+def test_image_dimension_cache_persists(tmp_path):
+    """Image sizes are reused from the on-disk cache until the file changes."""
+    from PIL import Image
+    from slide_generator.layout_engine import ImageDimensionCache
+
+    img_path = tmp_path / "img.png"
+    Image.new("RGB", (40, 20)).save(img_path)
+    cache_file = tmp_path / "imgdims.json"
+
+    cache = ImageDimensionCache(cache_file=cache_file)
+    assert cache.get_dimensions(str(img_path)) == (40, 20)
+    cache.flush()
+    assert cache_file.exists()
+
+    # A fresh cache answers from disk without opening the image
+    warm = ImageDimensionCache(cache_file=cache_file)
+    assert len(warm._disk_cache) == 1
+    assert warm.get_dimensions(str(img_path)) == (40, 20)
+    assert not warm._dirty
+
+    # Rewriting the image changes size/mtime and invalidates the entry
+    Image.new("RGB", (10, 30)).save(img_path)
+    edited = ImageDimensionCache(cache_file=cache_file)
+    assert edited.get_dimensions(str(img_path)) == (10, 30)
+
+    # The edit replaces the old entry, and deleted images are pruned on flush
+    other_path = tmp_path / "other.png"
+    Image.new("RGB", (5, 5)).save(other_path)
+    assert edited.get_dimensions(str(other_path)) == (5, 5)
+    other_path.unlink()
+    edited.flush()
+    assert list(ImageDimensionCache(cache_file=cache_file)._disk_cache) == [str(img_path)]
+
+
+def test_image_dimension_cache_prewarm(tmp_path):
+    """Prewarming probes every distinct image once and fills the cache."""
+    from PIL import Image
+    from slide_generator.layout_engine import ImageDimensionCache
+
+    paths = []
+    for i in range(5):
+        img_path = tmp_path / f"img{i}.png"
+        Image.new("RGB", (10 + i, 5)).save(img_path)
+        paths.append(str(img_path))
+
+    cache = ImageDimensionCache()
+    cache.prewarm(paths + paths[:2] + [str(tmp_path / "missing.png")])
+    assert {p: cache.cache[p] for p in paths} == {p: (10 + i, 5) for i, p in enumerate(paths)}
+
+
+def _block(tag, y, h, **kwargs):
+    """Full-width block at *y*, identified by its tag and position."""
+    return Block(tag=tag, x=19, y=y, w=100, h=h, bid=f"{tag}@{y}", **kwargs)
+
+
+def _bids(pages):
+    return [[block.bid for block in page] for page in pages]
+
+
+def test_paginate_keeps_heading_group_within_tolerance():
+    """An h1 and its child stay together if they overflow by at most 10 %."""
+    pages = paginate([_block('p', 0, 300), _block('h1', 300, 50), _block('p', 350, 170)], 500, 19)
+    assert _bids(pages) == [['p@0', 'h1@300', 'p@350']]
+
+    # Past the tolerance the overflowing child starts the next page
+    pages = paginate([_block('p', 0, 300), _block('h1', 300, 50), _block('p', 350, 200)], 500, 19)
+    assert _bids(pages) == [['p@0', 'h1@300'], ['p@350']]
+    assert pages[1][0].y == 19
+
+
+def test_paginate_lonely_heading_collects_overflowing_content():
+    """A heading alone on its page keeps the next block even if it overflows."""
+    pages = paginate([_block('h2', 0, 40), _block('p', 40, 600)], 500, 19)
+    assert _bids(pages) == [['h2@0', 'p@40']]
+    assert pages[0][1].oversized
+
+
+def test_paginate_separates_large_images():
+    """A large image fits after text, but a second large one gets its own page."""
+    pages = paginate([_block('p', 0, 100), _block('img', 100, 250)], 500, 19)
+    assert _bids(pages) == [['p@0', 'img@100']]
+
+    # Both images fit height-wise; the large-content rule still splits them
+    pages = paginate([_block('p', 0, 50), _block('img', 50, 210), _block('img', 260, 210)], 500, 19)
+    assert _bids(pages) == [['p@0', 'img@50'], ['img@260']]
+
+
+def test_paginate_page_break_advances_source_slide():
+    """Explicit page breaks end the page and advance source_slide."""
+    page_break = Block(tag='div', x=0, y=0, w=0, h=0, role='page_break')
+    blocks = [_block('h1', 0, 50), _block('p', 50, 100), page_break,
+              _block('p', 150, 80), _block('p', 230, 80)]
+    pages = paginate(blocks, 500, 19)
+    assert _bids(pages) == [['h1@0', 'p@50'], ['p@150', 'p@230']]
+    assert [[block.source_slide for block in page] for page in pages] == [[0, 0], [1, 1]]
+    # Every page is shifted so its top block sits at the padding
+    assert [[block.y for block in page] for page in pages] == [[19, 69], [19, 99]]
+
+
+def test_preprocess_flattens_nested_lists(tmp_path):
+    """Nested lists become one paragraph per top-level list with level metadata and BIDs."""
+    from bs4 import BeautifulSoup
+
+    engine = LayoutEngine(tmp_dir=tmp_path)
+    html = ('<div class="slide"><h1>Title</h1>'
+            '<ul><li>One<ul><li>Two<ol><li>Three</li></ol></li></ul></li><li>Four</li></ul>'
+            '<ol><li>A</li><li>B</li></ol></div>')
+    soup = BeautifulSoup(engine._preprocess_html_for_measurement(html), 'html.parser')
+
+    assert not soup.find_all(['ul', 'ol', 'li'])
+    lists = soup.find_all('p', attrs={'data-list-levels': True})
+    assert [(p['data-list-type'], p['data-list-levels']) for p in lists] == [('ul', '0,1,2,0'), ('ol', '0,0')]
+    assert [p.get_text('|') for p in lists] == ['One|Two|Three|Four', 'A|B']
+
+    # Every element in the slide has a unique BID, and the index points back at it
+    bids = [el['data-bid'] for el in soup.select('.slide *')]
+    assert soup.h1['data-bid'] == 'b0' and lists[0]['data-bid'] == 'b1'
+    assert len(bids) == len(set(bids))
+    assert all(engine._bid_index[bid]['data-bid'] == bid for bid in bids)